@@ -0,0 +1,440 @@
+# pylint: skip-file
+'''
+Benchmarks for gaplint, run with:
+
+    python benchmarks/gaplint.bench.py
+
+The throughput (lines per second) and peak memory of run_gaplint, and of
+some of the rules, are measured on a synthetic corpus of GAP files, see
+make_gap_lines and the options in --help. The results can be saved with
+--save, and compared with those of another revision with --compare.
+
+The time to import gaplint is also measured, and the benchmarks exit with
+status 1 if it exceeds IMPORT_TIME_BUDGET.
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(1, path)
+ROOT = path
+del path
+
+import gaplint
+
+def time_per_call(func, arg, number):
+    '''
+    Returns the best time in seconds of 3 runs of number calls func(arg).
+    '''
+    timer = timeit.Timer(lambda: func(arg))
+    return min(timer.repeat(3, number)) / number
+
+def bench_remove_comments():
+    '''
+    RemoveComments should take time linear in the length of a line, so the
+    time per character should not grow with the length of the line.
+    '''
+    rule = gaplint.RemoveComments('remove-comments', 'M001')
+    print 'RemoveComments (comment at the end of a line with strings)'
+    print '%10s %14s %14s' % ('length', 'usec/call', 'nsec/char')
+    for length in [100, 1000, 10000, 100000]:
+        chunk = 'x := "a string"; y := \'c\'; '
+        line = (chunk * (length // len(chunk) + 1))[:length] + '# comment\n'
+        number = max(1, 200000 // length)
+        t = time_per_call(rule, line, number)
+        print '%10d %14.2f %14.2f' % (length, t * 1e6, t * 1e9 / len(line))
+    print
+
+def bench_warn_regex_exceptions():
+    '''
+    The exceptions of a WarnRegex are matched once per line, so the time per
+    operator should not grow with the number of operators in a line.
+    '''
+    rules = [rule for rule in gaplint.RULES
+             if isinstance(rule, gaplint.WhitespaceOperator)]
+    print 'WhitespaceOperator rules (matrix literal with k entries)'
+    print '%10s %14s %14s' % ('k', 'usec/line', 'nsec/entry')
+    for k in [10, 100, 1000, 10000]:
+        line = ('[' + ', '.join('-%d*x^-%d' % (i, i) for i in xrange(k))
+                + '];\n')
+        number = max(1, 20000 // k)
+        t = time_per_call(lambda l: [rule(l) for rule in rules], line, number)
+        print '%10d %14.2f %14.2f' % (k, t * 1e6, t * 1e9 / k)
+    print
+
+################################################################################
+# Import time
+################################################################################
+
+# The time to import gaplint (in seconds) over the time to start Python
+IMPORT_TIME_BUDGET = 0.05
+
+def __best_process_time(code, repeat):
+    '''
+    Returns the best time in seconds of repeat runs of a new Python process
+    running code in the root of the repository.
+    '''
+    times = []
+    for i in xrange(repeat):
+        start = timeit.default_timer()
+        subprocess.check_call([sys.executable, '-c', code], cwd=ROOT)
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+def bench_import_time(repeat):
+    '''
+    Returns the time in seconds to import gaplint in a new process, over the
+    time to start Python. Importing gaplint should neither import yaml, nor
+    compile the rules, so that the startup does not dominate linting a few
+    files, for example in a pre-commit hook.
+    '''
+    # exits with status 1 if yaml is imported
+    seconds = (__best_process_time('import sys, gaplint; '
+                                   + 'sys.exit("yaml" in sys.modules)', repeat)
+               - __best_process_time('import sys', repeat))
+    return seconds
+
+################################################################################
+# Synthetic corpus
+################################################################################
+
+__OPERATORS = [' + ', ' - ', ' * ', ' / ', ' ^ ', ' mod ']
+__COMPARISONS = [' = ', ' <> ', ' < ', ' <= ', ' > ', ' >= ']
+
+def __make_term(rnd, lvars, op_density, string_density):
+    '''
+    Returns a random GAP expression: a string, a number, a local variable,
+    or (with probability op_density) a binary operation on two of them.
+    '''
+    if rnd.random() < string_density:
+        return '"a \\"string\\" # x"'
+    term = rnd.choice(lvars + [str(rnd.randint(1, 100))])
+    if rnd.random() < op_density:
+        term += rnd.choice(__OPERATORS) + rnd.choice(lvars + ['2'])
+    return term
+
+def __make_statement(rnd, indent, lvars, opts):
+    '''
+    Returns a line assigning a list of random terms to a local variable, of
+    at most opts.line_length characters (including indent) unless that is too
+    short for one term, with a comment at the end with probability
+    opts.comment_density.
+    '''
+    comment = ''
+    if rnd.random() < opts.comment_density:
+        comment = ' # a "comment"'
+    line = indent + rnd.choice(lvars) + ' := ['
+    terms = [__make_term(rnd, lvars, opts.op_density, opts.string_density)]
+    length = len(line) + len(terms[0]) + 2 + len(comment)
+    while True:
+        term = __make_term(rnd, lvars, opts.op_density, opts.string_density)
+        if length + len(term) + 2 > opts.line_length:
+            break
+        terms.append(term)
+        length += len(term) + 2
+    return line + ', '.join(terms) + '];' + comment + '\n'
+
+def __make_block(rnd, depth, indent, lvars, opts, out):
+    '''
+    Appends to out the lines of a block of statements, with nested if and
+    for statements up to depth levels deep.
+    '''
+    for i in xrange(3):
+        out.append(__make_statement(rnd, indent, lvars, opts))
+    if depth > 0:
+        if rnd.random() < 0.5:
+            out.append(indent + 'if ' + lvars[0] + rnd.choice(__COMPARISONS)
+                       + lvars[1] + ' then\n')
+            __make_block(rnd, depth - 1, indent + '  ', lvars, opts, out)
+            out.append(indent + 'else\n')
+            __make_block(rnd, depth - 1, indent + '  ', lvars, opts, out)
+            out.append(indent + 'fi;\n')
+        else:
+            out.append(indent + 'for ' + lvars[-1] + ' in [1 .. '
+                       + lvars[0] + '] do\n')
+            __make_block(rnd, depth - 1, indent + '  ', lvars, opts, out)
+            out.append(indent + 'od;\n')
+
+def make_gap_lines(rnd, opts, tst=False):
+    '''
+    Takes a random.Random and the options of the benchmarks, and returns the
+    list of lines of a synthetic GAP file with about opts.lines lines. The
+    file consists of functions, whose bodies have nested statements up to
+    opts.depth levels deep. If tst is True, then the lines are those of a
+    tst file, where every function is input at a gap> prompt.
+    '''
+    out = []
+    nr_funcs = 0
+    while len(out) < opts.lines:
+        lvars = ['x', 'y', 'z', 'i']
+        func = ['Func' + str(nr_funcs) + ' := function(x, y)\n',
+                '  local z, i;\n']
+        __make_block(rnd, opts.depth, '  ', lvars, opts, func)
+        func.append('  return z;\n')
+        func.append('end;\n')
+        if tst:
+            func = ['gap> ' + func[0]] + ['> ' + x for x in func[1:]]
+        out.extend(func)
+        out.append('\n')
+        nr_funcs += 1
+    return out
+
+def make_corpus(dirname, opts):
+    '''
+    Writes opts.files synthetic files (see make_gap_lines) to the directory
+    dirname, a fraction opts.tst_fraction of which are tst files, and returns
+    the pair (list of filenames, total number of lines).
+    '''
+    rnd = random.Random(opts.seed)
+    fnames, nr_lines = [], 0
+    nr_tst = int(round(opts.files * opts.tst_fraction))
+    for i in xrange(opts.files):
+        tst = i < nr_tst
+        lines = make_gap_lines(rnd, opts, tst)
+        if tst:
+            lines.append('gap> STOP_TEST("file' + str(i) + '.tst");\n')
+        fname = os.path.join(dirname, 'file' + str(i)
+                             + ('.tst' if tst else '.g'))
+        with open(fname, 'w') as f:
+            f.writelines(lines)
+        fnames.append(fname)
+        nr_lines += len(lines)
+    return fnames, nr_lines
+
+################################################################################
+# Throughput and memory
+################################################################################
+
+def __peak_memory_kb():
+    '''
+    Returns the peak resident memory of this process in kB.
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024 # bytes on OS X, kB on Linux
+    return peak
+
+def __run_in_child(queue, func, args):
+    start_kb = __peak_memory_kb()
+    try:
+        seconds = func(*args)
+    except BaseException as e: # so that the parent does not wait forever
+        queue.put(repr(e))
+        raise
+    queue.put((seconds, __peak_memory_kb(), __peak_memory_kb() - start_kb))
+
+def measure(func, args, nr_lines, repeat):
+    '''
+    Runs func(*args), which returns the time in seconds it spent on nr_lines
+    lines, repeat times, each in a new process, so that the peak memory of
+    each run is measured on its own. Returns a dictionary with the best
+    lines per second, the peak memory (in kB) of the process, and by how much
+    the run increased the peak memory.
+    '''
+    best = None
+    for i in xrange(repeat):
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=__run_in_child,
+                                       args=(queue, func, args))
+        proc.start()
+        out = queue.get()
+        proc.join()
+        if isinstance(out, str):
+            raise RuntimeError('the benchmark failed: ' + out)
+        seconds, peak_kb, growth_kb = out
+        if best is None or seconds < best[0]:
+            best = (seconds, peak_kb, growth_kb)
+    return {'lines_per_sec': nr_lines / max(best[0], 1e-9),
+            'peak_kb': best[1], 'growth_kb': best[2]}
+
+def __time_run_gaplint(fnames):
+    sys.argv = sys.argv[:1] # run_gaplint parses the command line
+    start = timeit.default_timer()
+    gaplint.run_gaplint(files=fnames, silent=True, cache=False,
+                        max_warnings=sys.maxint)
+    return timeit.default_timer() - start
+
+def __preprocessed_lines(fnames, codes):
+    '''
+    Returns the lines of the files, as they are given to the first rule
+    which is not in codes, that is, with the prefixes of tst files removed,
+    and processed by the rules with codes in codes.
+    '''
+    rules = [rule for rule in gaplint._make_rules() if rule.code in codes]
+    remove_prefix = gaplint.RemovePrefix()
+    out = []
+    for fname in fnames:
+        ext = fname.split('.')[-1]
+        with open(fname, 'r') as f:
+            for line in f:
+                line = remove_prefix(line, ext)
+                for rule in rules:
+                    line = rule(line).line
+                out.append(line)
+        for rule in rules:
+            rule.reset()
+        remove_prefix.reset()
+    return out
+
+def __time_rules(make_rules, lines):
+    rules = make_rules()
+    start = timeit.default_timer()
+    for line in lines:
+        for rule in rules:
+            rule(line)
+    return timeit.default_timer() - start
+
+def __remove_comments():
+    return [gaplint.RemoveComments('remove-comments', 'M001')]
+
+def __warn_regexes():
+    return [rule for rule in gaplint._make_rules()
+            if isinstance(rule, gaplint.WarnRegex)]
+
+def __warn_regex_group():
+    return [gaplint.WarnRegexGroup(__warn_regexes())]
+
+def __unused_lvars_func():
+    return [gaplint.UnusedLVarsFunc('unused-local-variables', 'W028')]
+
+def bench_corpus(opts):
+    '''
+    Generates a corpus (see make_corpus), and returns a dictionary whose
+    keys are the names of the benchmarks and whose values are as returned by
+    measure.
+    '''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fnames, nr_lines = make_corpus(tmpdir, opts)
+        # the lines as they are given to M001, and to the rules after M004
+        to_m001 = __preprocessed_lines(fnames, [])
+        after_m004 = __preprocessed_lines(fnames, ['M001', 'M002', 'M003',
+                                                   'M004'])
+        benches = [('run_gaplint', __time_run_gaplint, (fnames,)),
+                   ('RemoveComments', __time_rules,
+                    (__remove_comments, to_m001)),
+                   ('WarnRegex', __time_rules, (__warn_regexes, after_m004)),
+                   ('WarnRegexGroup', __time_rules,
+                    (__warn_regex_group, after_m004)),
+                   ('UnusedLVarsFunc', __time_rules,
+                    (__unused_lvars_func, after_m004))]
+        results = {}
+        for name, func, args in benches:
+            results[name] = measure(func, args, nr_lines, opts.repeat)
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+def __git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short',
+                                        'HEAD'], cwd=os.path.dirname(
+                                            os.path.abspath(__file__)),
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results, old=None):
+    '''
+    Prints the results of bench_corpus and bench_import_time, and if old is
+    not None, the ratio of the lines per second to those in old (the results
+    of another run), and the import time in old.
+    '''
+    print 'Importing gaplint (over starting Python)'
+    print '%14s %14s %14s' % ('msec', 'budget msec', 'before msec')
+    before = ''
+    if old is not None and 'import' in old:
+        before = '%14.1f' % (old['import']['seconds'] * 1e3)
+    print '%14.1f %14.1f %14s' % (results['import']['seconds'] * 1e3,
+                                  IMPORT_TIME_BUDGET * 1e3, before)
+    print
+    print 'Synthetic corpus'
+    print '%-16s %14s %12s %12s %8s' % ('benchmark', 'lines/sec', 'peak kB',
+                                        'growth kB', 'speedup')
+    for name in sorted(results):
+        if name == 'import':
+            continue
+        x = results[name]
+        ratio = ''
+        if old is not None and name in old:
+            ratio = '%7.2fx' % (x['lines_per_sec']
+                                / max(old[name]['lines_per_sec'], 1e-9))
+        print '%-16s %14.0f %12d %12d %8s' % (name, x['lines_per_sec'],
+                                              x['peak_kb'], x['growth_kb'],
+                                              ratio)
+    print
+
+def __parse_args():
+    parser = argparse.ArgumentParser(prog='gaplint.bench.py')
+    parser.add_argument('--files', type=int, default=20,
+                        help='number of files in the corpus (default: 20)')
+    parser.add_argument('--lines', type=int, default=500,
+                        help='number of lines per file (default: 500)')
+    parser.add_argument('--line-length', type=int, default=60,
+                        help='length of the lines of statements (default: 60)')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='nesting depth of statements (default: 3)')
+    parser.add_argument('--op-density', type=float, default=0.5,
+                        help='fraction of terms with an operator (default: '
+                        + '0.5)')
+    parser.add_argument('--string-density', type=float, default=0.1,
+                        help='fraction of terms which are strings (default: '
+                        + '0.1)')
+    parser.add_argument('--comment-density', type=float, default=0.2,
+                        help='fraction of statements with a comment (default: '
+                        + '0.2)')
+    parser.add_argument('--tst-fraction', type=float, default=0.25,
+                        help='fraction of files which are tst files (default: '
+                        + '0.25)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the random corpus (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs of every benchmark, the best is '
+                        + 'reported (default: 3)')
+    parser.add_argument('--save', type=str, metavar='FILE',
+                        help='save the results to FILE as JSON')
+    parser.add_argument('--compare', type=str, metavar='FILE',
+                        help='compare with the results saved in FILE')
+    parser.add_argument('--corpus-only', action='store_true',
+                        help='only run the benchmarks on the corpus, and of '
+                        + 'importing gaplint')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    opts = __parse_args()
+    if not opts.corpus_only:
+        bench_remove_comments()
+        bench_warn_regex_exceptions()
+
+    options = dict((key, value) for key, value in vars(opts).iteritems()
+                   if not key in ('save', 'compare', 'corpus_only'))
+    results = bench_corpus(opts)
+    results['import'] = {'seconds': bench_import_time(opts.repeat * 3)}
+    old = None
+    if opts.compare is not None:
+        with open(opts.compare, 'r') as f:
+            saved = json.load(f)
+        old = saved['results']
+        print 'Compared with revision', saved['revision'], 'in', opts.compare
+        if saved['options'] != options:
+            print 'WARNING: the options differ from those of', opts.compare
+    print_results(results, old)
+
+    if opts.save is not None:
+        with open(opts.save, 'w') as f:
+            json.dump({'revision': __git_revision(), 'options': options,
+                       'results': results}, f, indent=1, sort_keys=True)
+
+    if results['import']['seconds'] > IMPORT_TIME_BUDGET:
+        sys.exit('importing gaplint takes longer than the budget')
@@ -10,8 +10,14 @@ import re
 import sys
 import argparse
 import os
-import yaml
+import stat
 import copy
+import fnmatch
+import itertools
+import signal
+# hashlib, json, subprocess, timeit, traceback and StringIO are imported by
+# the functions which use them, since they slow down importing gaplint (see
+# benchmarks/gaplint.bench.py)
 
 ################################################################################
 # Globals
@@ -19,48 +25,77 @@ import copy
 
 _VERBOSE = False
 _SILENT = True
+_FORMAT = 'text'
+_COLOUR = 'auto'
 _VALID_EXTENSIONS = set(['g', 'g.txt', 'gi', 'gd', 'gap', 'tst', 'xml'])
+_CACHE_DIR = '.gaplint_cache'
+_CACHE_MAX_ENTRIES = 10000
 
 __DEFAULT_CONFIG = {'columns': 80, 'max_warnings': 1000, 'indentation': 2,
-                    'disable': []}
+                    'disable': [], 'exclude': [], 'report_unused_args': False}
 __CONFIG = {}
-__SUPPRESSIONS = {}
-__GLOBAL_SUPPRESSIONS = {}
-__USER_PREFERENCES_LOADED = False
+__HARDCODED_CONFIG = copy.deepcopy(__CONFIG)
 
 ################################################################################
 # Configuration
 ################################################################################
 
-def __get_config_yml_path(dir_path): 
-    '''
-    Recursive function that takes the path of a directory to search and searches 
-    for the gaplint.yml config script. If the script is not found the function
-    is then called on the parent directory - recursive case. This continues 
-    until we encounter a directory .git in our search (script not found, returns 
-    None), locate the script (returns script path), or until the root directory 
-    has been searched (script not found, returns None) - base cases A, B, C.
-    '''
-    assert os.path.isdir(dir_path)
-    entries = os.listdir(dir_path) # initialise list of entries in the...
-    # ...directory we are currently searching
-    for entry in entries:
-        # if entry a directory, True, else False
-        entry_isdir = os.path.isdir(os.path.abspath
-                                    (os.path.join(dir_path, entry))) 
-        if entry_isdir and entry == '.git': # base case A
-            return None
-        if not entry_isdir and entry == '.gaplint.yml': # base case B
-            yml_path = os.path.abspath(os.path.join(dir_path, '.gaplint.yml'))
-            return yml_path     
-    # if A and B not satisfied, recursive call made on parent directory
-    pardir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
-    # when os.pardir is called on the root directory path, it just returns the
-    # path to the root directory again, hence
-    if pardir_path == dir_path: # base case C
-        return None
-    return __get_config_yml_path(pardir_path) # recursive call
-    
+__CONFIG_YML_PATHS = {} # directory -> path of the .gaplint.yml for it, or None
+__CONFIG_YML_CONTENTS = {} # path of a .gaplint.yml -> (stat, contents)
+__CONFIGS = {} # path of a .gaplint.yml (or None) -> config dictionary of run
+
+def __get_config_yml_path(dir_path):
+    '''
+    Takes the path of a directory, and returns the path of the .gaplint.yml
+    config script which applies to the files in it. This is the script in the
+    directory, or else in its closest parent directory, but the search stops
+    at the root of a git repository (a directory containing .git), and at the
+    root directory. Returns None if no script is found.
+
+    Only two stats are made per directory, and the result is remembered for
+    every directory visited, so that finding the scripts for many files takes
+    one lookup per distinct directory. The remembered results are cleared at
+    the start of every run, see __load_user_preferences.
+    '''
+    dir_path = os.path.abspath(dir_path)
+    visited = []
+    while not dir_path in __CONFIG_YML_PATHS:
+        visited.append(dir_path)
+        yml_path = os.path.join(dir_path, '.gaplint.yml')
+        if os.path.isfile(yml_path):
+            break
+        yml_path = None
+        pardir_path = os.path.dirname(dir_path)
+        if os.path.exists(os.path.join(dir_path, '.git')) \
+                or pardir_path == dir_path:
+            break
+        dir_path = pardir_path
+    else:
+        yml_path = __CONFIG_YML_PATHS[dir_path]
+    for path in visited:
+        __CONFIG_YML_PATHS[path] = yml_path
+    return yml_path
+
+def __read_config_yml(ymlpath):
+    '''
+    Takes the path of a .gaplint.yml config script, and returns its contents
+    as loaded by yaml. The contents are kept, and the script is only loaded
+    again if it has been modified since, so that a long running process (such
+    as the server) does not load the same scripts for every run. Raises the
+    exceptions of os.stat, open and yaml.safe_load.
+    '''
+    import yaml # only imported if there is a script, since it is slow
+    st = os.stat(ymlpath)
+    st = (st.st_mtime, st.st_size, st.st_ino)
+    if not (ymlpath in __CONFIG_YML_CONTENTS
+            and __CONFIG_YML_CONTENTS[ymlpath][0] == st):
+        config_file = open(ymlpath, 'r')
+        try:
+            __CONFIG_YML_CONTENTS[ymlpath] = (st, yaml.safe_load(config_file))
+        finally:
+            config_file.close()
+    return copy.deepcopy(__CONFIG_YML_CONTENTS[ymlpath][1])
+
 def __valid_config_entry(dic, key):
     '''
     Takes a configuration dictionary and key and returns True if both the key
@@ -69,13 +104,14 @@ def __valid_config_entry(dic, key):
     '''
     assert isinstance(dic, dict) and isinstance(key, str)
     require_int = ['max_warnings', 'indentation', 'columns']
-    require_list_strings = ['disable']
+    require_list_strings = ['disable', 'exclude']
+    require_bool = ['report_unused_args']
     
     if not key in dic.keys(): # check key in dictionary
         _info_warn('gaplint: invalid key, ' + key + ' not in ' + dic)
         return False
     # check key is a valid config key
-    if not key in require_int + require_list_strings:
+    if not key in require_int + require_list_strings + require_bool:
         _info_warn('gaplint: invalid config key in __CONFIG: ' + key)
         return False
     if key in require_int: # check for correct int values
@@ -83,6 +119,11 @@ def __valid_config_entry(dic, key):
             _info_action('gaplint: incorrect config value, ' + key 
                          + ' requires an int')
             return False
+    if key in require_bool: # check for correct bool values
+        if not isinstance(dic[key], bool):
+            _info_action('gaplint: incorrect config value, ' + key
+                         + ' requires true or false')
+            return False
     if key in require_list_strings: # check for correct lists of strings
         val = dic[key]
         # accounting for case in which __CONFIG['disable'] = None
@@ -94,19 +135,18 @@ def __valid_config_entry(dic, key):
             return False        
     return True
 
-def __get_config_yml_dic():
+def __get_config_yml_dic(ymlpath):
     '''
-    Takes no argument. Attempts to open the config file at the path returned by
-    __get_yml_config_path. If the attempt is successful the yaml config file is
-    read yielding a dictionary which is returned. If the file cannot be opened,
-    an empty dictionary is returned.
+    Takes the path returned by __get_config_yml_path (or None). Attempts to
+    open the config file at the path. If the attempt is successful the yaml
+    config file is read yielding a dictionary which is returned. If the file
+    cannot be opened, an empty dictionary is returned.
     '''
-    ymlpath = __get_config_yml_path(os.getcwd()) 
     ymldic = {}    
     if not ymlpath == None:        
+        import yaml # only imported if there is a script, since it is slow
         try:
-            config_file = open(ymlpath, 'r')
-            ymldic = yaml.load(config_file)        
+            ymldic = __read_config_yml(ymlpath) or {} # None if file empty
         except yaml.scanner.ScannerError as e:
             _info_action('gaplint: error processing .gaplint.yml, '
                          + 'using default configuration values')        
@@ -120,13 +160,9 @@ def __get_config_yml_dic():
         for key in ymldic.keys(): 
             if not __valid_config_entry(ymldic, key):
                 del ymldic[key]
-        return ymldic
-    else:
-        _info_action('gaplint: config file .gaplint.yml not found, '
-                     + 'using default configuration values')
-    return {}
+    return ymldic
 
-def __make_code_list(rule_list):
+def _make_code_list(rule_list):
     '''
     Takes a list of rule names and codes and returns a list of the codes of the 
     rules given, excluding repetitions.
@@ -146,27 +182,32 @@ def __make_code_list(rule_list):
             codes_list.append(code)
     return codes_list
 
-def __set_user_config_dic(args):
+def __make_config_dic(args, ymlpath):
     '''
-    Takes a parser object as an argument. Consolidates user preferences given in
-    .gaplint.yml, the command line, and hardcoded in the gaplint.py global 
-    variable __CONFIG. Where different values are given for the same config 
-    option in any two or more of these ways, preference is given based on a 
-    configuration hierarchy. From top to bottom: __CONFIG, command line args,
-    .gaplint.ylml.
+    Takes a parser object and the path of a .gaplint.yml (or None) as
+    arguments. Consolidates user preferences given in the .gaplint.yml, the
+    command line, and hardcoded in the gaplint.py global variable
+    __HARDCODED_CONFIG, and returns the resulting config dictionary. Where
+    different values are given for the same config option in any two or more
+    of these ways, preference is given based on a configuration hierarchy.
+    From top to bottom: __HARDCODED_CONFIG, command line args, .gaplint.yml.
     '''
     assert isinstance(args, object)
-    global __CONFIG, __DEFAULT_CONFIG
+    global __DEFAULT_CONFIG
 
     # yml config 3rd in hierarchy
-    temp_config = __get_config_yml_dic() # our working config dictionary
-    temp_config['disable'] = __make_code_list(temp_config['disable'])
+    temp_config = __get_config_yml_dic(ymlpath) # our working config dictionary
+    temp_config['disable'] = _make_code_list(temp_config.get('disable'))
 
     # yml config superceded by command line options, 2nd in hierarchy
     # Note: args.disable returns a string of rules separated by commas - we make
-    # it into a list of rule codes.
-    rules_to_disable = [x.strip() for x in args.disable.split(',')]
-    rules_to_disable = __make_code_list(rules_to_disable)
+    # it into a list of rule codes. If run_gaplint is called with disable=[...]
+    # then args.disable is already a list.
+    rules_to_disable = args.disable
+    if isinstance(rules_to_disable, str):
+        rules_to_disable = [x.strip() for x in rules_to_disable.split(',')
+                            if x.strip()]
+    rules_to_disable = _make_code_list(rules_to_disable)
     if not rules_to_disable ==  __DEFAULT_CONFIG['disable']:
         temp_config['disable'] = rules_to_disable
     if not args.max_warnings == __DEFAULT_CONFIG['max_warnings']:
@@ -175,12 +216,48 @@ def __set_user_config_dic(args):
         temp_config['columns'] = args.columns
     if not args.indentation ==  __DEFAULT_CONFIG['indentation']:
         temp_config['indentation'] = args.indentation
+    if not (args.report_unused_args
+            == __DEFAULT_CONFIG['report_unused_args']):
+        temp_config['report_unused_args'] = args.report_unused_args
 
-    # Command line options superceded by contents of global variable __CONFIG, 
-    # top of hierarchy.
+    # Command line options superceded by contents of global variable
+    # __HARDCODED_CONFIG, top of hierarchy.
+    config = copy.deepcopy(__HARDCODED_CONFIG)
     for option in temp_config.keys():
+        if not option in config.keys():
+            config[option] = temp_config[option]
+    return config
+
+def __set_user_config_dic(args):
+    '''
+    Takes a parser object as an argument, and sets the global variable
+    __CONFIG to the config dictionary (see __make_config_dic) of the
+    .gaplint.yml for the current directory. This is the configuration of the
+    run, the configuration of every file is given by __get_file_config.
+    '''
+    global __CONFIG
+    ymlpath = __get_config_yml_path(os.getcwd())
+    if ymlpath == None:
+        _info_action('gaplint: config file .gaplint.yml not found, '
+                     + 'using default configuration values')
+    config = __make_config_dic(args, ymlpath)
+    for option in config.keys():
         if not option in __CONFIG.keys():
-            __CONFIG[option] = temp_config[option]
+            __CONFIG[option] = config[option]
+    __CONFIGS[ymlpath] = __CONFIG
+
+def __get_file_config(args, fname):
+    '''
+    Takes a parser object and a filename, and returns the config dictionary
+    for the file. This is given by the .gaplint.yml for the directory of the
+    file (see __get_config_yml_path), so that a directory (such as a package
+    in a larger repository) can have its own configuration. The dictionary
+    for every .gaplint.yml is only made once per run.
+    '''
+    ymlpath = __get_config_yml_path(os.path.dirname(os.path.abspath(fname)))
+    if not ymlpath in __CONFIGS:
+        __CONFIGS[ymlpath] = __make_config_dic(args, ymlpath)
+    return __CONFIGS[ymlpath]
 
 def __get_config_dic(choice):
     '''
@@ -193,15 +270,17 @@ def __get_config_dic(choice):
         return __CONFIG
     return __DEFAULT_CONFIG
 
-def _get_config_val(key):
+def _get_config_val(key, config=None):
     '''
     Takes a string (a configuration keyword) as an argument and returns the
     associated configuration value. If an invalid keyword is given an exception
-    is raised and we return. The contents of __CONFIG is checked first. If no 
-    specific user preferences have been expressed, we then retrieve the default
-    value from __DEFAULT_CONFIG.
+    is raised and we return. The contents of __CONFIG (or of the config
+    dictionary config, if given) is checked first. If no specific user
+    preferences have been expressed, we then retrieve the default value from
+    __DEFAULT_CONFIG.
     '''
-    config = __get_config_dic('user')
+    if config is None:
+        config = __get_config_dic('user')
     default = __get_config_dic('default')
     if key in config.keys():
         return config[key]
@@ -231,6 +310,26 @@ def _orange_string(string):
     assert isinstance(string, str)
     return '\033[40;38;5;208m' + string + '\033[0m'
 
+def _use_colour(stream):
+    '''
+    Returns True if the messages written to stream should be coloured: if the
+    option colour is 'always', or if it is 'auto' and stream is a terminal.
+    '''
+    if _COLOUR != 'auto':
+        return _COLOUR == 'always'
+    isatty = getattr(stream, 'isatty', None)
+    return isatty is not None and isatty()
+
+def _paint(colour, string, stream):
+    '''
+    Takes one of the functions above, a string, and a stream, and returns the
+    string coloured by the function if the stream is coloured, and the string
+    otherwise.
+    '''
+    if _use_colour(stream):
+        return colour(string)
+    return string
+
 def _pad(lines, linenum):
     return len(str(len(lines))) + 1 - len(str(linenum + 1))
 
@@ -244,36 +343,74 @@ def _eol(line):
 def _exit_abort(message=None):
     if message:
         assert isinstance(message, str)
-        sys.exit(_red_string('gaplint: ' + message + '! Aborting!'))
+        sys.exit(_paint(_red_string, 'gaplint: ' + message + '! Aborting!',
+                        sys.stderr))
     else:
-        sys.exit(_red_string('gaplint: Aborting!'))
+        sys.exit(_paint(_red_string, 'gaplint: Aborting!', sys.stderr))
 
 ################################################################################
 # Info messages
 ################################################################################
 
+def _info_stream():
+    '''
+    Returns the stream that messages are written to, this is stdout, unless
+    the warnings are written to stdout in a format other than text.
+    '''
+    return sys.stdout if _FORMAT == 'text' else sys.stderr
+
+class _OutputSink(object):
+    '''
+    Collects the text written to stdout and stderr about a file, so that it
+    can be written with as few writes as possible: consecutive pieces of text
+    for the same stream are joined, and written with a single write when the
+    sink is flushed. The order of the text is kept.
+    '''
+    def __init__(self):
+        self._chunks = [] # pairs (stream, list of text)
+
+    def write(self, stream, text):
+        if self._chunks and self._chunks[-1][0] is stream:
+            self._chunks[-1][1].append(text)
+        else:
+            self._chunks.append((stream, [text]))
+
+    def flush(self):
+        for stream, texts in self._chunks:
+            stream.write(''.join(texts))
+        self._chunks = []
+
+def _write(stream, text, sink=None):
+    if sink is None:
+        stream.write(text)
+    else:
+        sink.write(stream, text)
+
 def _info_statement(message):
     if not _SILENT:
         assert isinstance(message, str)
-        sys.stdout.write(_neon_green_string(message) + '\n')
+        stream = _info_stream()
+        stream.write(_paint(_neon_green_string, message, stream) + '\n')
 
 def _info_action(message):
     assert isinstance(message, str)
-    sys.stdout.write(_yellow_string(message) + '\n')
+    stream = _info_stream()
+    stream.write(_paint(_yellow_string, message, stream) + '\n')
 
-def _info_verbose(fname, linenum, message, pad=1):
+def _info_verbose(fname, linenum, message, pad=1, sink=None):
     if not _SILENT and _VERBOSE:
         assert isinstance(message, str)
-        sys.stdout.write(_orange_string(fname + ':' + str(linenum + 1)
-                                        + ' ' * pad + message))
+        stream = _info_stream()
+        _write(stream, _paint(_orange_string, fname + ':' + str(linenum + 1)
+                              + ' ' * pad + message, stream), sink)
 
-def _info_warn(fname, linenum, message, pad=1):
+def _info_warn(fname, linenum, message, pad=1, sink=None):
     if not _SILENT:
         assert isinstance(fname, str) and isinstance(message, str)
         assert isinstance(linenum, int) and isinstance(pad, int)
-        sys.stderr.write(_red_string('WARNING in ' + fname + ':'
-                                     + str(linenum + 1) + ' ' * pad
-                                     + message) + '\n')
+        _write(sys.stderr, _paint(_red_string, 'WARNING in ' + fname + ':'
+                                  + str(linenum + 1) + ' ' * pad + message,
+                                  sys.stderr) + '\n', sink)
 
 ################################################################################
 # Rule output
@@ -288,9 +425,12 @@ class RuleOutput(object):
         msg   (str) : a warning message (defaults to None)
         abort (bool): indicating if we should abort the script
                       (defaults to False)
+        col   (int) : the (0-based) position in the argument line that the
+                      warning is about, or None if there is no such position
+                      (defaults to None)
     '''
 
-    def __init__(self, line, msg=None, abort=False):
+    def __init__(self, line, msg=None, abort=False, col=None):
         '''
         This is used for the output of a rule as applied to line.
 
@@ -299,10 +439,13 @@ class RuleOutput(object):
             msg   (str) : a warning message (defaults to None)
             abort (bool): indicating if we should abort the script
                           (defaults to False)
+            col   (int) : the position in line of the warning, if any
+                          (defaults to None)
         '''
         self.line = line
         self.msg = msg
         self.abort = abort
+        self.col = col
 
 ################################################################################
 # Rules: a rule is just a function or callable class returning a RuleOutput
@@ -323,16 +466,120 @@ def _is_escaped(line, pos):
     # Search for an odd number of backslashes immediately before line[pos]
     return _ESCAPE_PATTERN.search(line[:pos][::-1])
 
+class Tokens(object):
+    '''
+    The words (keywords, identifiers and numbers) in a line.
+
+    Attributes:
+        line  (str)      : the line
+        names (frozenset): the set of words in line
+    '''
+    _word = re.compile(r'\w+')
+
+    def __init__(self, line):
+        self.line = line
+        self.names = frozenset(self._word.findall(line))
+        self._words = None
+
+    def words(self):
+        '''
+        Returns the list of triples (start, end, word) of the words in the line,
+        in the order they occur. This is only computed if it is required.
+        '''
+        if self._words is None:
+            self._words = [(m.start(), m.end(), m.group())
+                           for m in self._word.finditer(self.line)]
+        return self._words
+
+    def find(self, word):
+        '''
+        Returns the pair (start, end) of the first occurrence of word in the
+        line which is followed by another character, or None if there is no
+        such occurrence.
+        '''
+        if word in self.names:
+            length = len(self.line)
+            for start, end, other in self.words():
+                if other == word and end < length:
+                    return start, end
+        return None
+
+    def between(self, start, end):
+        '''
+        Returns the list of words that occur in line[start:end], or the empty
+        list if end is negative.
+        '''
+        return [word for wstart, wend, word in self.words()
+                if wstart >= start and wend <= end]
+
+class Tokenizer(object):
+    '''
+    This is not a rule. This is just a callable class which splits a line into
+    words, and returns a Tokens object.
+
+    Several rules need the words in the same line, so the tokens of the last
+    line are kept, and returned again if the same line is tokenized again.
+    '''
+    def __init__(self):
+        self._last = ('', Tokens(''))
+
+    def __call__(self, line):
+        last_line, tokens = self._last
+        if line is last_line or line == last_line:
+            return tokens
+        tokens = Tokens(line)
+        self._last = (line, tokens)
+        return tokens
+
+_tokenize = Tokenizer()
+
+class _cached_property(object):
+    '''
+    A decorator for a method of a class without arguments, which makes the
+    method an attribute, whose value is computed by the method the first time
+    the attribute is read, and then stored in the instance. This is used to
+    compile the regular expressions of a rule when it is first applied, not
+    when it is created (such as when this module is imported).
+    '''
+    def __init__(self, func):
+        self._func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = obj.__dict__[self._func.__name__] = self._func(obj)
+        return value
+
+class _Position(object):
+    '''
+    The position of a rule in the file it is applied to.
+
+    Attributes:
+        index (int): the (0-based) index of the line the rule is applied to
+
+    The Linter applying a rule sets index before the rule is applied to a
+    line, and all the rules of a Linter share a single _Position.
+    '''
+    def __init__(self):
+        self.index = 0
+
 class Rule(object):
     '''
     Base class for rules.
 
     A rule is a subclass of this class which has a __call__ method that returns
     a RuleOutput object.
+
+    The attribute triggers is None, or a list of strings, one of which must
+    occur in a line for the rule to produce a warning for the line, so that
+    the rule need not be applied to lines without any of them.
     '''
     def __init__(self, name, code):
         self.name = name
         self.code = code
+        self.triggers = None
+        self.position = _Position()
 
     def reset(self):
         '''
@@ -366,18 +613,26 @@ class RemoveComments(Rule):
     This rule does not return any warnings.
     '''
 
-    def _is_in_string(self, line, pos):
-        line = re.sub(r'\\.', '', line[:pos])
-        return line.count('"') % 2 == 1 or line.count("'") % 2 == 1
+    # A backslash and the character it escapes, or a quote or a hash.
+    _token = re.compile(r'\\[^\n]|["\'#]')
 
     def __call__(self, line):
         assert isinstance(line, str)
-        try:
-            i = next(i for i in xrange(len(line)) if line[i] == '#' and not
-                     self._is_in_string(line, i))
-        except StopIteration:
-            return RuleOutput(line)
-        return RuleOutput(line[:i] + _eol(line))
+        # The line is scanned once. The first # preceded by an even number of
+        # unescaped double quotes and an even number of unescaped single quotes
+        # starts a comment.
+        in_dq, in_sq = False, False
+        for m in self._token.finditer(line):
+            c = m.group()[-1]
+            if c == '#':
+                if not (in_dq or in_sq):
+                    return RuleOutput(line[:m.end() - 1] + _eol(line))
+            elif m.end() - m.start() == 1:
+                if c == '"':
+                    in_dq = not in_dq
+                else:
+                    in_sq = not in_sq
+        return RuleOutput(line)
 
 class ReplaceMultilineStrings(Rule):
     '''
@@ -508,6 +763,9 @@ class RemovePrefix(object):
         self._gt_prefix = re.compile(r'^>\s*')
         # TODO if linting an xml file warn about whitespace before gap> or >
 
+    def reset(self):
+        self._consuming = False
+
     def __call__(self, line, ext):
         if ext == 'tst' or ext == 'xml':
             m = self._gap_gt_prefix.search(line)
@@ -527,16 +785,24 @@ class RemovePrefix(object):
 
 class LineTooLong(Rule):
     '''
-    Warn if the length of a line exceeds 80 characters.
+    Warn if the length of a line exceeds 80 characters, or the number of
+    columns given, if any.
 
     This rule does not modify the line.
     '''
+    def __init__(self, name, code, columns=None):
+        Rule.__init__(self, name, code)
+        self._columns = columns
+
     def __call__(self, line):
         assert isinstance(line, str)
         ro = RuleOutput(line)
-        cols = _get_config_val('columns')
+        cols = self._columns
+        if cols is None:
+            cols = _get_config_val('columns')
         if len(line) > cols:
             ro.msg = 'too long line (%d / %d)' % (len(line) - 1, cols)
+            ro.col = cols
         return ro
 
 class WarnRegex(Rule):
@@ -552,46 +818,68 @@ class WarnRegex(Rule):
                  pattern,
                  warning_msg,
                  exceptions=[],
-                 skip=lambda ext: None):
+                 skip=lambda ext: None,
+                 triggers=None):
         #pylint: disable=bad-builtin, unnecessary-lambda, deprecated-lambda
         Rule.__init__(self, name, code)
         assert isinstance(pattern, str)
         assert isinstance(warning_msg, str)
         assert isinstance(exceptions, list)
         assert reduce(lambda x, y: x and isinstance(y, str), exceptions, True)
-
-        self._pattern = re.compile(pattern)
+        assert triggers is None or (isinstance(triggers, list)
+                                    and all(triggers))
+        self.triggers = triggers
+
+        self._pattern_source = pattern
+        # the start of a match of a pattern anchored at the start of the line
+        # says nothing about where the problem is
+        self._has_col = not pattern.startswith('^')
         self._warning_msg = warning_msg
-        self._exception_patterns = exceptions
-        self._exception_group = None
-        self._exceptions = map(lambda e: re.compile(e), exceptions)
+        self._exception_sources = exceptions
         self._skip = skip
 
+    @_cached_property
+    def _pattern(self):
+        return re.compile(self._pattern_source)
+
+    @_cached_property
+    def _exceptions(self):
+        return [re.compile(e) for e in self._exception_sources]
+
+    def _match_start(self, x):
+        '''
+        Returns the position in the line that a match x of the pattern of this
+        rule is compared to when checking for exceptions.
+        '''
+        return x.start()
+
+    def _exception_starts(self, line):
+        '''
+        Returns the set of the positions in the line of all of the matches of
+        the exceptions of this rule.
+        '''
+        return set(m.start() for e in self._exceptions
+                   for m in e.finditer(line))
+
     def __call__(self, line):
-        nr_matches = 0
-        msg = None
-        exception_group = self._exception_group
-        it = self._pattern.finditer(line)
-        for x in it:
+        msg, col = None, None
+        if self.triggers is not None and not any(t in line
+                                                 for t in self.triggers):
+            return RuleOutput(line)
+        exception_starts = None
+        for x in self._pattern.finditer(line):
             if len(self._exceptions) > 0:
-                exception = False
-                x_group = x.groups().index(exception_group) + 1
-                for e in self._exceptions:
-                    ite = e.finditer(line)
-                    for m in ite:
-                        m_group = m.groups().index(exception_group) + 1
-                        if m.start(m_group) == x.start(x_group):
-                            exception = True
-                            break
-                    if exception:
-                        break
-                else:
-                    nr_matches += 1
-            else:
-                nr_matches += 1
-        if nr_matches > 0:
+                # the exceptions are only matched once per line, and only if
+                # the pattern matches
+                if exception_starts is None:
+                    exception_starts = self._exception_starts(line)
+                if self._match_start(x) in exception_starts:
+                    continue
             msg = self._warning_msg
-        return RuleOutput(line, msg, False)
+            if self._has_col:
+                col = self._match_start(x)
+            break
+        return RuleOutput(line, msg, False, col)
 
     def skip(self, ext):
         return self._skip(ext)
@@ -600,6 +888,12 @@ class WhitespaceOperator(WarnRegex):
     '''
     Instances of this class produce a warning whenever the whitespace around an
     operator is incorrect.
+
+    A match is an exception if one of the exceptions matches the same operator,
+    i.e. the operator in the match and in the exception start at the same
+    position in the line.
+
+    Every match contains the operator, which is the trigger of the rule.
     '''
     def __init__(self, name, code, op, exceptions=[]):
         #pylint: disable=bad-builtin, deprecated-lambda, unnecessary-lambda
@@ -608,16 +902,159 @@ class WhitespaceOperator(WarnRegex):
         assert op[0] != '(' and op[-1] != ')'
         assert exceptions is None or isinstance(exceptions, list)
         assert reduce(lambda x, y: x and isinstance(y, str), exceptions, True)
+        # The operator is the only group in each alternative of the pattern, so
+        # it is the group x.lastindex of any match x.
         gop = '(' + op + ')'
-        pattern = (r'(\S' + gop + '|' + gop + r'\S|\s{2,}' + gop +
-                   '|' + gop + r'\s{2,})')
-        self._pattern = re.compile(pattern)
+        pattern = (r'\S' + gop + '|' + gop + r'\S|\s{2,}' + gop +
+                   '|' + gop + r'\s{2,}')
+        self._pattern_source = pattern
         self._warning_msg = ('wrong whitespace around operator '
                              + op.replace('\\', ''))
-        exceptions = map(lambda e: e.replace(op, '(' + op + ')'), exceptions)
-        self._exceptions = map(lambda e: re.compile(e), exceptions)
+        self._exception_sources = map(lambda e: e.replace(op, '(?P<op>' + op
+                                                          + ')', 1),
+                                      exceptions)
+        self.triggers = [op.replace('\\', '')]
+
+    def _match_start(self, x):
+        return x.start(x.lastindex)
+
+    def _exception_starts(self, line):
+        return set(m.start('op') for e in self._exceptions
+                   for m in e.finditer(line))
+
+def _non_capturing(pattern):
+    '''
+    Takes a regular expression and returns the same expression with all of its
+    capturing groups made non-capturing.
+    '''
+    assert isinstance(pattern, str)
+    out = []
+    i, n = 0, len(pattern)
+    in_class = False
+    while i < n:
+        c = pattern[i]
+        if c == '\\':
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            in_class = (c != ']' or pattern[i - 1] == '[' 
+                        or pattern[i - 2:i] == '[^')
+        elif c == '[':
+            in_class = True
+        elif c == '(' and pattern[i + 1:i + 2] != '?':
+            c = '(?:'
+        out.append(c)
+        i += 1
+    return ''.join(out)
+
+class WarnRegexGroup(object):
+    '''
+    This is not a rule. This is just a callable class which applies a list of
+    WarnRegex rules to a line, and returns a list of the pairs (rule, output)
+    for the rules in the list which produce a warning.
+
+    Rather than running the pattern of every rule over the line, the rules
+    whose triggers (see Rule) do not occur in the line are discarded. If many
+    rules remain, and the same rules remain for many lines, then their
+    patterns are combined into a single pattern which finds the rules whose
+    patterns match somewhere in the line in one scan. Only the rules whose
+    patterns match are then applied to the line, so the exceptions of the
+    rules are unchanged.
+    '''
+    def __init__(self, rules):
+        assert all(isinstance(rule, WarnRegex) for rule in rules)
+        self.rules = rules
+        self._sources = [_non_capturing(rule._pattern_source)
+                         for rule in rules]
+        # The rule self.rules[i] corresponds to the bit 1 << i
+        self._always = 0  # the rules without triggers
+        self._char_bits = {} # the rules with a trigger starting with a char
+        self._literals = [] # pairs (bit, triggers) if a trigger is not a char
+        for i, rule in enumerate(rules):
+            if rule.triggers is None:
+                self._always |= 1 << i
+                continue
+            for trigger in rule.triggers:
+                self._char_bits[trigger[0]] = (self._char_bits.get(trigger[0],
+                                                                   0)
+                                               | 1 << i)
+            if any(len(trigger) > 1 for trigger in rule.triggers):
+                self._literals.append((1 << i, rule.triggers))
+        self._trigger_chars = frozenset(self._char_bits)
+        self._combined = {}
+
+    def _triggered(self, line):
+        '''
+        Returns the bits of the rules whose triggers occur in the line.
+        '''
+        bits = self._always
+        for c in self._trigger_chars.intersection(line):
+            bits |= self._char_bits[c]
+        for bit, triggers in self._literals:
+            if bits & bit and not any(t in line for t in triggers):
+                bits &= ~bit
+        return bits
+
+    # The patterns of a combination of rules are only combined if there are at
+    # least _COMBINE_MIN_RULES rules, and after _COMBINE_AFTER lines with the
+    # combination. Compiling takes longer than scanning a few lines with every
+    # pattern, and scanning with a few patterns is as fast as with one.
+    _COMBINE_AFTER = 16
+    _COMBINE_MIN_RULES = 12
+
+    def _get_combined(self, bits):
+        '''
+        Returns a list, whose first entry is the list of the indices of the
+        rules corresponding to bits, and whose second entry is the combined
+        pattern of these rules, or None if it is not (yet) compiled. The
+        patterns are compiled once for every combination of rules that occurs
+        often enough, up to a limit.
+        '''
+        entry = self._combined.get(bits)
+        if entry is None:
+            if len(self._combined) >= 1024:
+                self._combined.clear()
+            indices = [i for i in xrange(len(self.rules)) if bits & 1 << i]
+            entry = self._combined[bits] = [indices, None, 0]
+        elif entry[1] is None and len(entry[0]) >= self._COMBINE_MIN_RULES:
+            entry[2] += 1
+            if entry[2] >= self._COMBINE_AFTER:
+                sources = [self._sources[i] for i in entry[0]]
+                # The lookahead at the start only succeeds at the positions
+                # where one of the patterns matches, and at these positions
+                # the k-th group captures the match of the k-th pattern (if
+                # any).
+                entry[1] = re.compile('(?=' + '|'.join(sources) + ')'
+                                      + ''.join('(?:(?=(' + source + '))|)'
+                                                for source in sources))
+        return entry
+
+    def matching(self, line):
+        '''
+        Returns the sorted list of the indices of the rules whose pattern
+        matches somewhere in the line.
+        '''
+        bits = self._triggered(line)
+        if not bits:
+            return []
+        indices, combined = self._get_combined(bits)[:2]
+        if combined is None:
+            return [i for i in indices if self.rules[i]._pattern.search(line)]
+        found = set()
+        for m in combined.finditer(line):
+            found.update(indices[k] for k, x in enumerate(m.groups())
+                         if x is not None)
+        return sorted(found)
 
-        self._exception_group = op.replace('\\', '')
+    def __call__(self, line):
+        out = []
+        for i in self.matching(line):
+            rule = self.rules[i]
+            ro = rule(line)
+            if ro.msg:
+                out.append((rule, ro))
+        return out
 
 class Indentation(Rule):
     '''
@@ -626,47 +1063,128 @@ class Indentation(Rule):
     Certain keywords increase the indentation level, while others decrease it,
     this rule checks that a given line has the minimum indentation level
     required.
+
+    The blocks which are open are also kept, so that a keyword closing a block
+    of another kind (such as od closing an if) is reported, together with the
+    line where the block was opened.
     '''
-    def __init__(self, name, code):
+    # the keywords opening a block, and the keywords closing them
+    _opening = frozenset(['if', 'for', 'while', 'repeat', 'function'])
+    _opened_by = {'fi': ['if'], 'od': ['for', 'while'], 'until': ['repeat'],
+                  'end': ['function']}
+
+    def __init__(self, name, code, indentation=None):
         Rule.__init__(self, name, code)
-        ind = _get_config_val('indentation')
+        self._indentation = indentation
         self._expected = 0
-        self._before = [(re.compile(r'(\W|^)(elif|else)(\W|$)'), -ind),
-                        (re.compile(r'(\W|^)end(\W|$)'), -ind),
-                        (re.compile(r'(\W|^)(od|fi)(\W|$)'), -ind),
-                        (re.compile(r'(\W|^)until(\W|$)'), -ind)]
-        self._after = [(re.compile(r'(\W|^)(then|do)(\W|$)'), -ind),
-                       (re.compile(r'(\W|^)(repeat|else)(\W|$)'), ind),
-                       (re.compile(r'(\W|^)function(\W|$)'), ind),
-                       (re.compile(r'(\W|^)(if|for|while|elif)(\W|$)'), 2*ind)]
-        self._indent = re.compile(r'^(\s*)\S')
-        self._blank = re.compile(r'^\s*$')
+        self._bits = None # set when the rule is first applied
+        self._before = None
+        self._after = None
+        self._shift = None # the bits of the keywords in after start here
+        self._keywords = None
+        self._block_keywords = None
+        self._blocks = [] # pairs (keyword, index of line) of the open blocks
+
+    def _set_levels(self):
+        '''
+        Sets the changes of the indentation level before and after lines with
+        certain keywords. If no indentation was given, then the configured
+        value is used, which is only known once the rule is applied.
+
+        Every set of keywords below changes the level once, however many of
+        its keywords a line contains. Every keyword is given a bit for every
+        set it is in, and the changes are looked up by the union of the bits
+        of the keywords in a line.
+        '''
+        ind = self._indentation
+        if ind is None:
+            ind = _get_config_val('indentation')
+        before = [(frozenset(['elif', 'else']), -ind),
+                  (frozenset(['end']), -ind),
+                  (frozenset(['od', 'fi']), -ind),
+                  (frozenset(['until']), -ind)]
+        after = [(frozenset(['then', 'do']), -ind),
+                 (frozenset(['repeat', 'else']), ind),
+                 (frozenset(['function']), ind),
+                 (frozenset(['if', 'for', 'while', 'elif']), 2*ind)]
+        self._bits = {}
+        for i, (keywords, _) in enumerate(before + after):
+            for keyword in keywords:
+                self._bits[keyword] = self._bits.get(keyword, 0) | 1 << i
+        self._keywords = frozenset(self._bits)
+        self._block_keywords = re.compile(
+            r'\b(?:' + '|'.join(sorted(self._opening.union(self._opened_by)))
+            + r')\b')
+        self._before = [sum(x[1] for j, x in enumerate(before) if bits & 1 << j)
+                        for bits in xrange(1 << len(before))]
+        self._after = [sum(x[1] for j, x in enumerate(after) if bits & 1 << j)
+                       for bits in xrange(1 << len(after))]
+        self._shift = len(before)
+        # every union of bits is a valid index of both tables
+        assert len(self._before) == 1 << self._shift
+        assert all(bits >> self._shift < len(self._after)
+                   for bits in self._bits.values())
 
     def __call__(self, line):
         assert self._expected >= 0
+        if self._bits is None:
+            self._set_levels()
         ro = RuleOutput(line)
-        if self._blank.search(line):
+        if not line or line.isspace():
             return ro
-        for pair in self._before:
-            if pair[0].search(line):
-                self._expected += pair[1]
-
-        if self._get_indent_level(line) < self._expected:
-            ro.msg = ('bad indentation: found ' +
-                      str(self._get_indent_level(line)) +
+        keywords = self._keywords.intersection(_tokenize(line).names)
+        bits = 0
+        if keywords:
+            for keyword in keywords:
+                bits |= self._bits[keyword]
+            self._match_blocks(line, ro)
+        self._expected += self._before[bits & (len(self._before) - 1)]
+
+        indent = len(line) - len(line.lstrip())
+        if indent < self._expected and not ro.msg:
+            ro.msg = ('bad indentation: found ' + str(indent) +
                       ' expected at least ' + str(self._expected))
-        for pair in self._after:
-            if pair[0].search(line):
-                self._expected += pair[1]
+        self._expected += self._after[bits >> self._shift]
         return ro
 
-    def _get_indent_level(self, line):
-        indent = self._indent.search(line)
-        assert indent
-        return len(indent.group(1))
+    def _match_blocks(self, line, ro):
+        '''
+        Takes a line containing some keywords, and the RuleOutput for the line.
+        Opens and closes the blocks for the keywords in the line, in order, and
+        sets the message of ro if a keyword does not close the innermost open
+        block.
+        '''
+        blocks = self._blocks
+        for k, word in enumerate(self._block_keywords.findall(line)):
+            if word in self._opening:
+                blocks.append((word, self.position.index))
+                continue
+            openers = self._opened_by.get(word)
+            if openers is None:
+                continue
+            if blocks and blocks[-1][0] in openers:
+                blocks.pop()
+                continue
+            if ro.msg is None: # only the first mismatch in a line
+                ro.col = list(self._block_keywords.finditer(line))[k].start()
+                if blocks:
+                    ro.msg = ('\'' + word + '\' does not match the \''
+                              + blocks[-1][0] + '\' opened in line '
+                              + str(blocks[-1][1] + 1))
+                else:
+                    ro.msg = ('\'' + word + '\' without a matching \''
+                              + '\' or \''.join(openers) + '\'')
+            # the blocks opened after the block closed by word are not closed
+            for i in xrange(len(blocks) - 1, -1, -1):
+                if blocks[i][0] in openers:
+                    del blocks[i:]
+                    break
 
     def reset(self):
         self._expected = 0
+        self._blocks = []
+        if self._indentation is None: # the configured value may change
+            self._bits = None
 
     def skip(self, ext):
         return _skip_tst_or_xml_file(ext)
@@ -694,19 +1212,25 @@ class ConsecutiveEmptyLines(WarnRegex):
 
 class UnusedLVarsFunc(Rule):
     '''
-    This rule checks if there are unused local variables in a function.
+    This rule checks if there are unused local variables in a function, and,
+    if report_args is True, unused function arguments.
+
+    A name used in a line is the local variable or argument of the innermost
+    function declaring it, which is looked up in a dictionary from names to
+    the depths of the functions declaring them, so that the time spent on a
+    line does not depend on how deeply the functions are nested.
     '''
-    def __init__(self, name, code):
+    def __init__(self, name, code, report_args=False):
         Rule.__init__(self, name, code)
+        self._report_args = report_args
         self._consuming_args = False
         self._consuming_lvars = False
         self._depth = -1
-        self._args = []
-        self._lvars = []
-        self._function_p = re.compile(r'(^|\W)(function)(\W)')
-        self._end_p = re.compile(r'(^|\W)end\W')
-        self._local_p = re.compile(r'(^|\W)(local)(\W)')
-        self._var_p = re.compile(r'\w+')
+        self._args = [] # the unused arguments of the functions, by depth
+        self._lvars = [] # the unused local variables of the functions
+        self._names = [] # the names declared by the functions
+        self._lines = [] # the indices of the lines declaring the functions
+        self._scopes = {} # name -> depths of the functions declaring name
         self._keywords = {'true', 'false', 'continue', 'break', 'if', 'fi',
                           'else', 'for', 'od', 'while', 'repeat', 'until',
                           'return', '__REMOVED_STRING__', '__REMOVED_CHAR__'}
@@ -717,20 +1241,34 @@ class UnusedLVarsFunc(Rule):
         self._depth = -1
         self._args = []
         self._lvars = []
+        self._names = []
+        self._lines = []
+        self._scopes = {}
+
+    def _declare(self, var):
+        '''
+        Declares the name var in the innermost function.
+        '''
+        self._names[self._depth].append(var)
+        depths = self._scopes.get(var)
+        if depths is None:
+            self._scopes[var] = [self._depth]
+        else:
+            depths.append(self._depth)
 
 
     def _is_function_declared(self, line):
-        return self._function_p.search(line)
+        return _tokenize(line).find('function')
 
     def _is_end_declared(self, line):
-        return self._end_p.search(line)
+        return _tokenize(line).find('end')
 
     def _is_local_declared(self, line):
-        return self._local_p.search(line)
+        return _tokenize(line).find('local')
 
     def _add_function_args(self, line, start=0, end=-1):
         ro = RuleOutput(line)
-        new_args = self._var_p.findall(line, start, end)
+        new_args = _tokenize(line).between(start, end)
         args = self._args[self._depth]
         for var in new_args:
             if var in args:
@@ -741,11 +1279,12 @@ class UnusedLVarsFunc(Rule):
                 ro.abort = True
             else:
                 args.add(var)
+                self._declare(var)
         self._consuming_args = (line.find(')', start) == -1)
         return ro
 
     def _new_function(self, line):
-        m = self._function_p.search(line)
+        m = self._is_function_declared(line)
         assert m
         assert not self._consuming_args and not self._consuming_lvars
         self._depth += 1
@@ -753,29 +1292,37 @@ class UnusedLVarsFunc(Rule):
         assert self._depth == len(self._lvars)
         self._lvars.append(set())
         self._args.append(set())
-        start = line.find('(', m.start(3)) + 1
+        self._names.append([])
+        self._lines.append(self.position.index)
+        start = line.find('(', m[1]) + 1
         end = line.find(')', start)
         if end == -1:
             self._consuming_args = True
         return self._add_function_args(line, start, end)
 
     def _end_function(self, line):
-        assert self._end_p.search(line)
+        assert self._is_end_declared(line)
         assert not self._consuming_args and not self._consuming_lvars
 
         ro = RuleOutput(line)
         self._depth -= 1
-        lvars = [key for key in self._lvars.pop()]
-        args = [key for key in self._args.pop()]
-        # TODO should use the number of the line where function declared
+        lvars = sorted(self._lvars.pop())
+        args = sorted(self._args.pop())
+        for var in self._names.pop():
+            depths = self._scopes[var]
+            depths.pop()
+            if not depths:
+                del self._scopes[var]
+        declared = ' (function declared in line ' + str(self._lines.pop() + 1)
+        msgs = []
         if len(lvars) != 0:
-            ro.msg = 'unused local variables: '
-            ro.msg += reduce(lambda x, y: x + ', ' + y, lvars[1:], lvars[0])
-        # TODO the following produces too many warnings, there are plenty of
-        # places where there are legitimately unused function arguments
-        #if len(args) != 0:
-        #    ro.msg = 'unused function arguments: '
-        #    ro.msg += reduce(lambda x, y: x + ', ' + y, args[1:], args[0])
+            msgs.append('unused local variables: ' + ', '.join(lvars))
+        # This is off by default, since there are plenty of places where there
+        # are legitimately unused function arguments.
+        if self._report_args and len(args) != 0:
+            msgs.append('unused function arguments: ' + ', '.join(args))
+        if msgs:
+            ro.msg = '; '.join(msgs) + declared + ')'
         return ro
 
     def _add_lvars(self, line):
@@ -784,7 +1331,7 @@ class UnusedLVarsFunc(Rule):
         self._consuming_lvars = (end == -1)
         lvars = self._lvars[self._depth]
         args = self._args[self._depth]
-        new_lvars = self._var_p.findall(line, 0, end)
+        new_lvars = _tokenize(line).between(0, end)
         for var in new_lvars:
             if var in lvars:
                 ro.msg = 'name used for two locals: ' + var
@@ -797,13 +1344,16 @@ class UnusedLVarsFunc(Rule):
                 ro.abort = True
             elif var != 'local':
                 lvars.add(var)
+                self._declare(var)
         return ro
 
     def _remove_lvars(self, line):
         ro = RuleOutput(line)
-        lvars = self._var_p.findall(line)
-        for var in lvars:
-            for depth in xrange(0, self._depth + 1):
+        scopes = self._scopes
+        for var in _tokenize(line).names:
+            depths = scopes.get(var)
+            if depths is not None:
+                depth = depths[-1]
                 self._lvars[depth].discard(var)
                 self._args[depth].discard(var)
             # could detect unbound globals here (maybe)
@@ -832,18 +1382,210 @@ class UnusedLVarsFunc(Rule):
     def skip(self, ext):
         return _skip_tst_or_xml_file(ext)
 
+################################################################################
+# Changed files
+################################################################################
+
+_HUNK_PATTERN = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+def _has_valid_extension(fname):
+    return (fname.split('.')[-1] in _VALID_EXTENSIONS
+            or '.'.join(fname.split('.')[-2:]) in _VALID_EXTENSIONS)
+
+def __git(git_args, cwd=None):
+    '''
+    Takes a list of arguments, runs git with them, and returns its output, or
+    aborts if git cannot be run or fails.
+    '''
+    import subprocess
+    try:
+        return subprocess.check_output(['git'] + git_args, cwd=cwd)
+    except (OSError, subprocess.CalledProcessError):
+        _exit_abort('git ' + ' '.join(git_args) + ' failed')
+
+def __get_changed_files(ref):
+    '''
+    Takes a git ref, and returns a dictionary whose keys are the paths
+    (relative to the current directory) of the files with a valid extension in
+    the git repository containing the current directory that have changed
+    since ref, or are untracked. The value of a file which has changed is the
+    set of the (0-based) numbers of the lines added or changed since ref, and
+    the value of an untracked file is None (every line is new).
+    '''
+    top = __git(['rev-parse', '--show-toplevel']).rstrip('\n')
+    changed = {}
+    linenums = None
+    # The paths in the headers of a diff can be quoted, or followed by a tab,
+    # so they are taken from --name-only -z instead, which lists the files in
+    # the same order, one for every 'diff --git' header.
+    diff_args = ['--no-ext-diff', '--diff-filter=d', ref, '--']
+    paths = __git(['diff', '--name-only', '-z'] + diff_args, top).split('\0')
+    diff = __git(['diff', '-U0', '--no-color'] + diff_args, top)
+    path = None
+    nr_files = 0
+    for line in diff.splitlines():
+        if line.startswith('diff --git '):
+            path = paths[nr_files]
+            nr_files += 1
+            linenums = None
+        elif line.startswith('+++ ') and path is not None:
+            linenums = set()
+            changed[path] = linenums
+        elif line.startswith('@@') and linenums is not None:
+            hunk = _HUNK_PATTERN.match(line)
+            start = int(hunk.group(1))
+            count = 1 if hunk.group(2) is None else int(hunk.group(2))
+            linenums.update(xrange(start - 1, start - 1 + count))
+    untracked = __git(['ls-files', '-z', '--others', '--exclude-standard'],
+                      top)
+    for path in untracked.split('\0'):
+        if path:
+            changed[path] = None
+    return dict((os.path.relpath(os.path.join(top, path)), linenums)
+                for path, linenums in changed.iteritems()
+                if _has_valid_extension(path))
+
+def __is_in_paths(path, paths):
+    '''
+    Takes an absolute path, and a list of absolute paths of files and
+    directories, and returns True if path is one of them, or is in one of the
+    directories.
+    '''
+    return any(path == x or path.startswith(os.path.join(x, ''))
+               for x in paths)
+
+################################################################################
+# Finding files in directories
+################################################################################
+
+def __is_excluded(path, exclude):
+    '''
+    Takes a path and a list of glob patterns, and returns True if the path, or
+    its last component, matches any of the patterns.
+    '''
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(name, pattern)
+               for pattern in exclude)
+
+def __subpaths(dir_path, path):
+    '''
+    Takes the path of a directory and the path of a file in it, and returns a
+    list containing the path of the file, and the paths of the directories
+    containing it below the directory.
+    '''
+    out = []
+    dir_path = os.path.normpath(dir_path)
+    while path != dir_path and os.path.dirname(path) != path:
+        out.append(path)
+        path = os.path.dirname(path)
+    return out
+
+def __is_in_git_work_tree(dir_path):
+    '''
+    Takes the path of a directory and returns True if it is in a git work tree.
+    '''
+    import subprocess
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(['git', 'rev-parse',
+                                    '--is-inside-work-tree'], cwd=dir_path,
+                                   stdout=devnull, stderr=devnull) == 0
+    except OSError: # git is not installed
+        return False
+
+def __walk_git_dir(dir_path):
+    '''
+    Takes the path of a directory in a git work tree, and yields the paths of
+    the files in the directory which are tracked or untracked but not ignored,
+    as soon as git lists them. If git fails, then the files in the directory
+    which are not yet yielded are yielded by __walk_dir.
+    '''
+    import subprocess
+    yielded = set()
+    devnull = open(os.devnull, 'w')
+    try:
+        proc = subprocess.Popen(['git', 'ls-files', '-z', '--cached',
+                                 '--others', '--exclude-standard'],
+                                cwd=dir_path, stdout=subprocess.PIPE,
+                                stderr=devnull)
+    except OSError: # git is not installed
+        proc = None
+    finally:
+        devnull.close() # the child has its own copy
+    if proc is not None:
+        try:
+            rest = ''
+            for chunk in iter(lambda: os.read(proc.stdout.fileno(), 65536),
+                              ''):
+                paths = (rest + chunk).split('\0')
+                rest = paths.pop()
+                for path in paths:
+                    # the paths are relative to dir_path, where git runs
+                    path = os.path.join(dir_path, path)
+                    yielded.add(os.path.normpath(path))
+                    yield path
+        finally:
+            proc.stdout.close()
+            proc.wait()
+    if proc is None or proc.returncode != 0:
+        for path in __walk_dir(dir_path):
+            if not os.path.normpath(path) in yielded:
+                yield path
+
+def __walk_dir(dir_path):
+    '''
+    Takes the path of a directory, and yields the paths of the files in the
+    directory and its subdirectories (except .git), in sorted order.
+    '''
+    for root, dirnames, fnames in os.walk(dir_path):
+        dirnames[:] = sorted(x for x in dirnames if x != '.git')
+        for fname in sorted(fnames):
+            yield os.path.join(root, fname)
+
+def __iter_files(args):
+    '''
+    Takes a parser object and yields the files to lint: the files in
+    args.files, and the files with a valid extension in the directories in
+    args.files, which are found while the files already found are linted. In a
+    git work tree, the files ignored by git are skipped. The files (and
+    directories) matching the glob patterns in the config value exclude are
+    skipped.
+    '''
+    exclude = _get_config_val('exclude') or [] # None if empty in yml file
+    for path in args.files:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        if __is_in_git_work_tree(path):
+            found = __walk_git_dir(path)
+        else:
+            found = __walk_dir(path)
+        for fname in found:
+            fname = os.path.normpath(fname)
+            if (_has_valid_extension(fname) and os.path.isfile(fname)
+                    and not any(__is_excluded(x, exclude)
+                                for x in __subpaths(path, fname))):
+                yield fname
+
 ################################################################################
 # Functions for running this as a script instead of a module
 ################################################################################
 
 def _parse_args(kwargs):
-    global _SILENT, _VERBOSE #pylint: disable=global-statement
+    #pylint: disable=global-statement
+    global _SILENT, _VERBOSE, _FORMAT, _COLOUR, __CONFIG
+    # Start from the hardcoded contents of __CONFIG, so that the options of one
+    # run do not spill over into the next run.
+    __CONFIG = copy.deepcopy(__HARDCODED_CONFIG)
+
     parser = argparse.ArgumentParser(prog='gaplint',
                                      usage='%(prog)s [options]')
     if __name__ == '__main__':
-        parser.add_argument('files', nargs='+', help='the files to lint')
+        parser.add_argument('files', nargs='*',
+                            help='the files (and directories) to lint')
 
-    parser.add_argument('--max_warnings', nargs='?', type=int,
+    parser.add_argument('--max_warnings', '--max-warnings', nargs='?',
+                        type=int,
                         help='max number of warnings reported (default: 1000)')    
     parser.set_defaults(max_warnings=_get_config_val('max_warnings'))
 
@@ -859,6 +1601,12 @@ def _parse_args(kwargs):
                         help='indentation of nested statements (default: 2)')
     parser.set_defaults(indentation=_get_config_val('indentation'))
 
+    parser.add_argument('--report-unused-args', dest='report_unused_args',
+                        action='store_true', help='also report unused '
+                        + 'function arguments (default: False)')
+    parser.set_defaults(report_unused_args=_get_config_val(
+        'report_unused_args'))
+
     parser.add_argument('--silent', dest='silent', action='store_true',
                         help='silence all warnings (default: False)')
     parser.set_defaults(silent=False)
@@ -867,6 +1615,76 @@ def _parse_args(kwargs):
                         help=' (default: False)')
     parser.set_defaults(verbose=False)
 
+    parser.add_argument('--jobs', nargs='?', type=int,
+                        help='number of files linted in parallel, 0 means one '
+                        + 'per CPU (default: 1)')
+    parser.set_defaults(jobs=1)
+
+    parser.add_argument('--fail-fast', dest='fail_fast', action='store_true',
+                        help='stop after the first file with warnings '
+                        + '(default: False)')
+    parser.set_defaults(fail_fast=False)
+
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='do not reuse or store the warnings for files '
+                        + 'in ' + _CACHE_DIR + ' (default: False)')
+    parser.set_defaults(cache=True)
+
+    parser.add_argument('--changed-since', dest='changed_since', type=str,
+                        metavar='REF', help='lint the files changed since the '
+                        + 'git ref REF, and the untracked files, in the files '
+                        + 'and directories given, if any (default: None)')
+    parser.set_defaults(changed_since=None)
+
+    parser.add_argument('--only-changed-lines', dest='only_changed_lines',
+                        action='store_true', help='with --changed-since, only '
+                        + 'report warnings in the changed lines (default: '
+                        + 'False)')
+    parser.set_defaults(only_changed_lines=False)
+
+    parser.add_argument('--stdin-filename', dest='stdin_filename', type=str,
+                        metavar='FNAME', help='lint the lines read from stdin, '
+                        + 'as if they were the contents of the file FNAME '
+                        + '(default: None)')
+    parser.set_defaults(stdin_filename=None)
+
+    parser.add_argument('--format', dest='format', type=str,
+                        choices=['text'] + sorted(_WRITERS.keys()),
+                        help='the format of the warnings written to stdout, '
+                        + 'other messages are then written to stderr '
+                        + '(default: text)')
+    parser.set_defaults(format='text')
+
+    parser.add_argument('--colour', dest='colour', type=str,
+                        choices=['auto', 'always', 'never'],
+                        help='colour the messages, auto means only if they '
+                        + 'are written to a terminal (default: auto)')
+    parser.set_defaults(colour='auto')
+
+    parser.add_argument('--server', dest='server', action='store_true',
+                        help='run a server which lints files for gaplint '
+                        + '--client (default: False)')
+    parser.set_defaults(server=False)
+
+    parser.add_argument('--client', dest='client', action='store_true',
+                        help='lint the files in a server started with gaplint '
+                        + '--server, if any (default: False)')
+    parser.set_defaults(client=False)
+
+    parser.add_argument('--socket', dest='socket', type=str,
+                        help='the socket of the server (default: '
+                        + 'gaplint.sock in $XDG_RUNTIME_DIR, or else in a '
+                        + 'directory gaplint-<uid> in the temporary '
+                        + 'directory)')
+    parser.set_defaults(socket=None)
+
+    parser.add_argument('--profile-rules', dest='profile_rules', type=str,
+                        nargs='?', const='table', choices=['table', 'json'],
+                        help='write the time spent in every rule, and in '
+                        + 'every file, to stderr at the end as a table or as '
+                        + 'JSON (default: None, or table if no value given)')
+    parser.set_defaults(profile_rules=None)
+
     args = parser.parse_args()
 
     if 'silent' in kwargs:
@@ -887,18 +1705,75 @@ def _parse_args(kwargs):
         args.disable = kwargs['disable']
     if 'indentation' in kwargs:
         args.indentation = kwargs['indentation'] 
-
-    if __name__ != '__main__':
-        if not ('files' in kwargs and isinstance(kwargs['files'], list)):
-            _exit_abort('no files specified or not specified in a list')
-        args.files = kwargs['files']
+    if 'report_unused_args' in kwargs:
+        args.report_unused_args = kwargs['report_unused_args']
+    if 'jobs' in kwargs:
+        args.jobs = kwargs['jobs']
+    if 'fail_fast' in kwargs:
+        args.fail_fast = kwargs['fail_fast']
+    if 'cache' in kwargs:
+        args.cache = kwargs['cache']
+    elif __name__ != '__main__': # do not leave caches in the cwd of callers
+        args.cache = False
+    if 'changed_since' in kwargs:
+        args.changed_since = kwargs['changed_since']
+    if 'only_changed_lines' in kwargs:
+        args.only_changed_lines = kwargs['only_changed_lines']
+    if args.jobs is None or args.jobs <= 0:
+        import multiprocessing
+        args.jobs = multiprocessing.cpu_count()
+    if 'stdin_filename' in kwargs:
+        args.stdin_filename = kwargs['stdin_filename']
+    if 'format' in kwargs:
+        args.format = kwargs['format']
+    if not args.format in _WRITERS and args.format != 'text':
+        _exit_abort('unknown format ' + str(args.format))
+    _FORMAT = args.format
+    if 'colour' in kwargs:
+        args.colour = kwargs['colour']
+    _COLOUR = args.colour
+    if 'client' in kwargs:
+        args.client = kwargs['client']
+    if 'profile_rules' in kwargs:
+        args.profile_rules = kwargs['profile_rules']
+    if not args.profile_rules in [None, 'table', 'json']:
+        _exit_abort('unknown rule profile format ' + str(args.profile_rules))
+    if args.server or args.client:
+        return args # the files are linted by the server
+
+    args.changed_lines = None
+    if args.changed_since is not None:
+        changed = __get_changed_files(args.changed_since)
+        paths = (args.files if __name__ == '__main__'
+                 else kwargs.get('files'))
+        if paths: # only the changed files in the files and directories given
+            paths = [os.path.abspath(x) for x in paths]
+            changed = dict((fname, linenums)
+                           for fname, linenums in changed.iteritems()
+                           if __is_in_paths(os.path.abspath(fname), paths))
+        args.files = sorted(fname for fname in changed
+                            if os.path.isfile(fname))
+        if args.only_changed_lines:
+            args.changed_lines = changed
+    else:
+        if __name__ != '__main__':
+            if 'files' in kwargs or args.stdin_filename is None:
+                if not isinstance(kwargs.get('files'), list):
+                    _exit_abort('no files specified or not specified in a '
+                                + 'list')
+                args.files = kwargs['files']
+            else:
+                args.files = []
+        elif not args.files and args.stdin_filename is None:
+            parser.error('no files specified')
 
     files = []
     for fname in args.files:
-        if not (os.path.exists(fname) and os.path.isfile(fname)):
+        if os.path.isdir(fname):
+            files.append(fname)
+        elif not (os.path.exists(fname) and os.path.isfile(fname)):
             _info_action('SKIPPING ' + fname + ': cannot open for reading')
-        elif (not fname.split('.')[-1] in _VALID_EXTENSIONS
-              and not '.'.join(fname.split('.')[-2:]) in _VALID_EXTENSIONS):
+        elif not _has_valid_extension(fname):
             _info_action('IGNORING ' + fname + ': not a valid file extension')
         else:
             files.append(fname)
@@ -917,74 +1792,99 @@ def _parse_args(kwargs):
 # TODO allow skipping a file in that file
 # gaplint: skip-file
 
-_remove_prefix = RemovePrefix()
-RULES = [LineTooLong('line-too-long', 'W001'),
-         ConsecutiveEmptyLines('empty-lines', 'W002'),
-         WarnRegex('trailing-whitespace', 'W003', r'^.*\s+\n$',
-                   'trailing whitespace!', [], _skip_tst_or_xml_file),
-         RemoveComments('remove-comments', 'M001'),
-         ReplaceMultilineStrings('replace-multiline-strings', 'M002'),
-         ReplaceQuotes('replace-double-quotes', 'M003', '"', 
-                       '__REMOVED_STRING__'),
-         ReplaceQuotes('replace-escaped-quotes', 'M004', r'\'', 
-                       '__REMOVED_CHAR__'),
-         Indentation('indentation', 'W004'),
-         WarnRegex('space-after-comma', 'W005',
-                    r',(([^,\s]+)|(\s{2,})\w)', 
-                    'exactly one space required after comma'),
-         WarnRegex('space-before-comma', 'W006', r'\s,', 
-                   'no space before comma'),
-         WarnRegex('space-after-bracket', 'W007', 
-                    r'(\(|\[|\{)[ \t\f\v]', 'no space allowed after bracket'),
-         WarnRegex('space-before-bracket', 'W008', r'\s(\)|\]|\})',
-                   'no space allowed before bracket'),
-         WarnRegex('multiple-semicolons', 'W009', r';.*;',
-                   'more than one semicolon!', [], _skip_tst_or_xml_file),
-         WarnRegex('keyword-function', 'W010', 
-                    r'(\s|^)function[^\(]', 
-                    'keyword function not followed by ('),
-         WarnRegex('whitespace-op-colon-equals', 'W011', 
-                   r'(\S:=|:=(\S|\s{2,}))', 
-                   'wrong whitespace around operator :='),
-         WarnRegex('tabs', 'W012', r'\t',
-                   'there are tabs in this line, replace with spaces!'),
-         WarnRegex('function-local-same-line', 'W013', 
-                   r'function\W.*\Wlocal\W', 
-                   'keywords function and local in the same line'),
-         WhitespaceOperator('whitespace-op-plus', 'W014',
-                            r'\+', [r'^\s*\+']),
-         WhitespaceOperator('whitespace-op-multiply', 'W015', 
-                            r'\*', [r'^\s*\*', r'\\\*']),
-         WhitespaceOperator('whitespace-op-negative', 'W016', 
-                            r'-', [r'-(>|\[)', r'(\^|\*|,|=|\.|>) -',
-                            r'(\(|\[)-', r'return -infinity', r'return -\d']),
-         WarnRegex('whitespace-op-minus', 'W017', 
-                   r'(return|\^|\*|,|=|\.|>) - \d',
-                   'wrong whitespace around operator -'),
-         WhitespaceOperator('whitespace-op-less-than', 'W018', 
-                            r'\<', [r'^\s*\<', r'\<(\>|=)', r'\\\<']),
-         WhitespaceOperator('whitespace-op-less-equal', 'W019', 
-                            r'\<='),
-         WhitespaceOperator('whitespace-op-more-than', 'W020', r'\>', 
-                            [r'(-|\<)\>', r'\>=']),
-         WhitespaceOperator('whitespace-op-more-equal', 'W021', 
-                            r'\>='),
-         WhitespaceOperator('whitespace-op-equals', 'W022', r'=', 
-                            [r'(:|>|<)=', r'^\s*=', r'\\=']),
-         WhitespaceOperator('whitespace-op-mapping', 'W023', r'->'),
-         WhitespaceOperator('whitespace-op-divide', 'W024', r'\/', 
-                            [r'\\\/']),
-         WhitespaceOperator('whitespace-op-power', 'W025', r'\^', 
-                            [r'^\s*\^', r'\\\^']),
-         WhitespaceOperator('whitespace-op-not-equal', 'W026', 
-                            r'<>', [r'^\s*<>']),
-         WhitespaceOperator('whitespace-double-dot', 'W027', r'\.\.', 
-                            [r'\.\.(\.|\))']),
-         UnusedLVarsFunc('unused-local-variables', 'W028')]
+def _make_rules(columns=None, indentation=None, report_unused_args=None):
+    '''
+    Returns a new list of instances of all the rules, in the order they are
+    applied. The rules keep state while linting a file, so every Linter has
+    its own instances. If columns, indentation or report_unused_args is None,
+    then the configured value is used.
+    '''
+    if report_unused_args is None:
+        report_unused_args = _get_config_val('report_unused_args')
+    return [LineTooLong('line-too-long', 'W001', columns),
+            ConsecutiveEmptyLines('empty-lines', 'W002'),
+            WarnRegex('trailing-whitespace', 'W003', r'^.*\s+\n$',
+                      'trailing whitespace!', [], _skip_tst_or_xml_file),
+            RemoveComments('remove-comments', 'M001'),
+            ReplaceMultilineStrings('replace-multiline-strings', 'M002'),
+            ReplaceQuotes('replace-double-quotes', 'M003', '"', 
+                          '__REMOVED_STRING__'),
+            ReplaceQuotes('replace-escaped-quotes', 'M004', r'\'', 
+                          '__REMOVED_CHAR__'),
+            Indentation('indentation', 'W004', indentation),
+            WarnRegex('space-after-comma', 'W005',
+                       r',(([^,\s]+)|(\s{2,})\w)', 
+                       'exactly one space required after comma',
+                      triggers=[',']),
+            WarnRegex('space-before-comma', 'W006', r'\s,', 
+                      'no space before comma',
+                      triggers=[',']),
+            WarnRegex('space-after-bracket', 'W007', 
+                       r'(\(|\[|\{)[ \t\f\v]',
+                       'no space allowed after bracket',
+                      triggers=['(', '[', '{']),
+            WarnRegex('space-before-bracket', 'W008', r'\s(\)|\]|\})',
+                      'no space allowed before bracket',
+                      triggers=[')', ']', '}']),
+            WarnRegex('multiple-semicolons', 'W009', r';.*;',
+                      'more than one semicolon!', [], _skip_tst_or_xml_file,
+                      triggers=[';']),
+            WarnRegex('keyword-function', 'W010', 
+                       r'(\s|^)function[^\(]', 
+                       'keyword function not followed by (',
+                      triggers=['function']),
+            WarnRegex('whitespace-op-colon-equals', 'W011', 
+                      r'(\S:=|:=(\S|\s{2,}))', 
+                      'wrong whitespace around operator :=',
+                      triggers=[':=']),
+            WarnRegex('tabs', 'W012', r'\t',
+                      'there are tabs in this line, replace with spaces!',
+                      triggers=['\t']),
+            WarnRegex('function-local-same-line', 'W013', 
+                      r'function\W.*\Wlocal\W', 
+                      'keywords function and local in the same line',
+                      triggers=['local']),
+            WhitespaceOperator('whitespace-op-plus', 'W014',
+                               r'\+', [r'^\s*\+']),
+            WhitespaceOperator('whitespace-op-multiply', 'W015', 
+                               r'\*', [r'^\s*\*', r'\\\*']),
+            WhitespaceOperator('whitespace-op-negative', 'W016', 
+                               r'-', [r'-(>|\[)', r'(\^|\*|,|=|\.|>) -',
+                               r'(\(|\[)-', r'return -infinity',
+                               r'return -\d']),
+            WarnRegex('whitespace-op-minus', 'W017', 
+                      r'(return|\^|\*|,|=|\.|>) - \d',
+                      'wrong whitespace around operator -',
+                      triggers=[' - ']),
+            WhitespaceOperator('whitespace-op-less-than', 'W018', 
+                               r'\<', [r'^\s*\<', r'\<(\>|=)', r'\\\<']),
+            WhitespaceOperator('whitespace-op-less-equal', 'W019', 
+                               r'\<='),
+            WhitespaceOperator('whitespace-op-more-than', 'W020', r'\>', 
+                               [r'(-|\<)\>', r'\>=']),
+            WhitespaceOperator('whitespace-op-more-equal', 'W021', 
+                               r'\>='),
+            WhitespaceOperator('whitespace-op-equals', 'W022', r'=', 
+                               [r'(:|>|<)=', r'^\s*=', r'\\=']),
+            WhitespaceOperator('whitespace-op-mapping', 'W023', r'->'),
+            WhitespaceOperator('whitespace-op-divide', 'W024', r'\/', 
+                               [r'\\\/']),
+            WhitespaceOperator('whitespace-op-power', 'W025', r'\^', 
+                               [r'^\s*\^', r'\\\^']),
+            WhitespaceOperator('whitespace-op-not-equal', 'W026', 
+                               r'<>', [r'^\s*<>']),
+            WhitespaceOperator('whitespace-double-dot', 'W027', r'\.\.', 
+                               [r'\.\.(\.|\))']),
+            UnusedLVarsFunc('unused-local-variables', 'W028',
+                            report_unused_args)]
+
+RULES = _make_rules()
 
 __RULE_NAMES_AND_CODES = []
 for rule in RULES:
     __RULE_NAMES_AND_CODES.append([rule.name, rule.code])
+__RULE_BITS = dict((rule.code, 1 << i) for i, rule in enumerate(RULES))
+_RULE_NAMES = dict((rule.code, rule.name) for rule in RULES)
 
 def __get_all_rules_list(choice):
     '''
@@ -1049,200 +1949,1227 @@ def __unpack_tuple_list(tuplist):
                 supp_codes.append(code)
     return supp_codes
 
-def __get_global_suppdic(fname, lines):
-    '''
-    Takes a list of lines and returns a dictionary with globally suppressed 
-    rules as entries, all assigned the value True. Global suppressions are 
-    stated anywhere in a GAP script before any code is written (i.e. if they are 
-    preceded by only by empty lines, whitespace and comments). The normal
-    '# gaplint: disable=' syntax is used.
-    '''
-    assert (isinstance(fname, str) and isinstance(lines, list)
-            and all(isinstance(x, str) for x in lines))
+_SUPP_HEADER_PATTERN = re.compile(r'^\s*($|#)') # empty/commented lines
+_SUPP_GLOBAL_PATTERN = re.compile(r'\s*#\s*gaplint:\s*disable\s*=\s*')
+_SUPP_LINE_PATTERN = re.compile(r'#\s*gaplint:\s*disable\s*=\s*')
+_SUPP_NEXTLINE_PATTERN = re.compile(r'#\s* gaplint:\s*disable\(nextline\)=\s*')
+_SUPP_RULES_PATTERN = re.compile(r'((\w+(-\w+)*)+(-\S+){0,1})')
 
-    codes = __get_all_rules_list('codes')
-    pattern1 = re.compile('^\s*($|#)') # empty/commented lines
-    pattern2 = re.compile('\s*#\s*gaplint:\s*disable\s*=\s*') # keywords
-    pattern3 = re.compile('((\w+(-\w+)*)+(-\S+){0,1})') # rules    
-    n = len(lines)    
-    i = 0
-    line = lines[0]
-    G_suppdic = {} # to hold codes of rules to suppress
-    # we start searching at the top of the script and continue as long as we 
-    # only encounter only whitespace, empty lines, comments and suppression
-    # statements
-    while re.search(pattern1, line) and i < n: 
-        match = re.search(pattern2, line)
-        if match: # have found '# gaplint: disable=' in a line
-            match = pattern3.findall(line[match.end():]) # extract rules
-            supp_codes = __unpack_tuple_list(match) # make code list           
-            # special case A
-            if not len(supp_codes): # if no rules are given after keywords
-                _info_warn(fname, i, 'global suppressions: invalid/no rule '
-                           + 'code(s) or name(s) given')
-            # special case B
-            if supp_codes == codes: # i.e. rule = 'all'
-                return make_dic(codes, [True for x in codes])
-            # general case: add global suppressions to dictionary
-            # rule codes as keys with value True
-            for code in supp_codes:
-                if not code in G_suppdic.keys():
-                    G_suppdic[code] = True
-        i += 1
-        line = lines[i]
-    return G_suppdic
-
-def __get_line_suppressions(fname, line, linenum):
+def _get_line_suppressions(fname, line, linenum, notes):
     '''
-    Takes a filename, string and line number. Returns a dictionary whose keys
-    are the suppressed rules for the line, all assigned value True, and a 
-    boolean value True if the rules are to be applied to the next line and
-    False if not. If the suppression keywords are present, but no/invalid rules 
-    follow, a warning is thrown. A list is returned. The first element of which 
-    is the bool, the second the dictionary.
+    Takes a filename, string, line number and a list. Returns a dictionary
+    whose keys are the suppressed rules for the line, all assigned value True,
+    and a boolean value True if the rules are to be applied to the next line
+    and False if not. If the suppression keywords are present, but no/invalid
+    rules follow, a warning is appended to the list notes. A list is returned.
+    The first element of which is the bool, the second the dictionary.
     '''
     assert (all(isinstance(x, str) for x in [fname, line])
             and isinstance(linenum, int))
-    n = len(line)
-    pattern1 = re.compile('#\s*gaplint:\s*disable\s*=\s*') # line
-    pattern2 = re.compile('#\s* gaplint:\s*disable\(nextline\)=\s*') # nextline
-    match1 = pattern1.search(line)
-    match2 = pattern2.search(line)
+    match1 = _SUPP_LINE_PATTERN.search(line)
+    match2 = _SUPP_NEXTLINE_PATTERN.search(line)
     is_nextline = False
     
     if match1 or match2:
-        pattern = re.compile('((\w+(-\w+)*)+(-\S+){0,1})') # rules
         if match2: # suppressions apply to next line
             is_nextline = True        
-            match = pattern.findall(line[match2.end():]) # get rules
-            valid = __unpack_tuple_list(match) # get codes
+            match = _SUPP_RULES_PATTERN.findall(line[match2.end():]) # rules
         else: # same line suppressions
-            match = pattern.findall(line[match1.end():]) # get rules 
-            valid = __unpack_tuple_list(match) # get codes
+            match = _SUPP_RULES_PATTERN.findall(line[match1.end():]) # rules
+        valid = __unpack_tuple_list(match) # get codes
         if not len(valid): # if no rules are given after keywords
-            _info_warn(fname, linenum, 
-                       'suppressions: invalid/no rule code(s) or name(s) given')
+            notes.append((linenum, 'suppressions: invalid/no rule code(s) or '
+                          + 'name(s) given'))
             return [is_nextline, {}]
         else:
-            return [is_nextline, make_dic(valid, [True for x in valid])]
+            return [is_nextline, __make_dic(valid, [True for x in valid])]
     return [is_nextline, {}]
 
-def __get_lines_suppdic(fname, lines):
+def _get_suppdics(fname, lines, notes):
     '''
-    Takes a filename and a list the lines of the file as strings. Returns a
-    2D dictionary whose keys are the indices of lines with rule suppressions.
-    Their values are dictionaries whose keys are the rules suppressed in the
-    lines, all assigned value True. This includes global suppressions.
+    Takes a filename, a list of the lines of the file as strings, and a list.
+    Returns a pair of dictionaries found in a single pass over the lines. The
+    first has the globally suppressed rules as keys, all assigned the value
+    True. Global suppressions are stated anywhere in a GAP script before any
+    code is written (i.e. if they are preceded by only by empty lines,
+    whitespace and comments). The normal '# gaplint: disable=' syntax is used.
+    The second is a 2D dictionary whose keys are the indices of lines with
+    rule suppressions. Their values are dictionaries whose keys are the rules
+    suppressed in the lines, all assigned value True. Warnings about invalid
+    suppressions are appended to the list notes.
     '''
     assert (isinstance(fname, str) and isinstance(lines, list)
             and all(isinstance(x, str) for x in lines))
+    codes = __get_all_rules_list('codes')
+    G_suppdic = {} # to hold codes of rules to suppress in the whole file
     dic = {} # suppression codes for each line of a GAP script.
-    n = len(lines)
-    for i in range(n):
-        line_supp_dic = __get_line_suppressions(fname, lines[i], i)
+    in_header = True # only whitespace, empty lines and comments so far
+    for i, line in enumerate(lines):
+        if in_header and not _SUPP_HEADER_PATTERN.search(line):
+            in_header = False
+        if not 'gaplint' in line: # cheap test, most lines have no suppressions
+            continue
+        if in_header:
+            match = _SUPP_GLOBAL_PATTERN.search(line)
+            if match: # have found '# gaplint: disable=' in a line
+                # extract rules and make code list
+                supp_codes = __unpack_tuple_list(
+                    _SUPP_RULES_PATTERN.findall(line[match.end():]))
+                # special case A
+                if not len(supp_codes): # if no rules are given after keywords
+                    notes.append((i, 'global suppressions: invalid/no rule '
+                                  + 'code(s) or name(s) given'))
+                # special case B
+                if supp_codes == codes: # i.e. rule = 'all'
+                    return __make_dic(codes, [True for x in codes]), {}
+                # general case: add global suppressions to dictionary
+                # rule codes as keys with value True
+                for code in supp_codes:
+                    G_suppdic[code] = True
+                continue
+        line_supp_dic = _get_line_suppressions(fname, line, i, notes)
         if len(line_supp_dic[1].keys()) > 0: # if there are line suppressions
+            linenum = i
             if line_supp_dic[0]: # if they apply to the next line
-                i += 1 # if nextline increment line index by 1
-            if not i in dic.keys(): # if not yet any suppressions
-                dic[i] = line_supp_dic[1] 
+                linenum += 1 
+            if not linenum in dic.keys(): # if not yet any suppressions
+                dic[linenum] = line_supp_dic[1] 
             else: # add to existing suppressions
-                 for code in line_supp_dic[1].keys():
-                    if not code in dic[i].keys():
-                        dic[i][code] = True
-    return dic
+                dic[linenum].update(line_supp_dic[1])
+    return G_suppdic, dic
+
+def _get_rule_plan(all_rules, disable, ext, global_suppdic, lines_suppdic,
+                   groups):
+    '''
+    Takes a list of rules (as returned by _make_rules), a list of codes of
+    disabled rules, the extension of a file, its global and line
+    suppressions (as returned by _get_suppdics), and the dictionary of
+    WarnRegexGroups of the rules (see __group_warn_regexes), and returns a
+    pair. The first
+    entry is the list of rules to apply to every line of the file: those which
+    are not skipped for the extension, disabled, or suppressed for the whole
+    file. The second entry is a dictionary whose keys are the
+    indices of lines with rule suppressions, and whose values are the lists of
+    rules to apply to those lines instead.
+
+    This is computed once per file, so that nothing has to be looked up for
+    each line and rule when the file is linted.
+    '''
+    assert isinstance(ext, str)
+    disabled = 0 # a bitmask, the rule RULES[i] corresponds to the bit 1 << i
+    for code in disable:
+        disabled |= __RULE_BITS.get(code, 0)
+    for code in global_suppdic:
+        disabled |= __RULE_BITS[code]
+
+    rules = [(__RULE_BITS[rule.code], rule) for rule in all_rules
+             if not (rule.skip(ext) or disabled & __RULE_BITS[rule.code])]
+
+    line_rules = {}
+    for linenum, codes in lines_suppdic.iteritems():
+        suppressed = 0
+        for code in codes:
+            suppressed |= __RULE_BITS[code]
+        line_rules[linenum] = __group_warn_regexes([rule for bit, rule in rules
+                                                    if not suppressed & bit],
+                                                   groups)
+    return (__group_warn_regexes([rule for bit, rule in rules], groups),
+            line_rules)
+
+def __group_warn_regexes(rules, groups):
+    '''
+    Takes a list of rules and a dictionary, and returns the same list where
+    every run of consecutive WarnRegex or WhitespaceOperator rules is replaced
+    by a single WarnRegexGroup. The groups are kept in the dictionary, keyed
+    by the codes of their rules, so that the patterns they combine are only
+    compiled once. Every Linter has its own dictionary, since a group holds
+    the instances of the rules of the Linter which made it.
+    '''
+    out, run = [], []
+    for rule in rules + [None]:
+        if type(rule) in (WarnRegex, WhitespaceOperator):
+            run.append(rule)
+            continue
+        if len(run) > 1:
+            key = tuple(x.code for x in run)
+            if not key in groups:
+                groups[key] = WarnRegexGroup(run)
+            out.append(groups[key])
+        else:
+            out.extend(run)
+        run = []
+        if rule is not None:
+            out.append(rule)
+    return out
+
+
+################################################################################
+# user preferences
+################################################################################
+
+def __load_user_preferences(args):
+    '''
+    Takes a parser object as argument and populates the global variable
+    __CONFIG based on user preferences. The suppressions in a file are found
+    when the file is read, see __load_file.
+    '''
+    assert isinstance(args, object)
+    # the config scripts may have been added, removed or changed since the
+    # last run, in a long running process
+    __CONFIG_YML_PATHS.clear()
+    __CONFIGS.clear()
+    __set_user_config_dic(args)
+
+################################################################################
+# Result cache
+################################################################################
+
+__SOURCE_SHA = None
+
+def _source_sha():
+    '''
+    Returns the sha1 of the source code of gaplint, which stands in for its
+    version.
+    '''
+    global __SOURCE_SHA
+    import hashlib
+    if __SOURCE_SHA is None: # the source of a running process cannot change
+        try:
+            ffile = open(re.sub(r'\.py[co]$', '.py', __file__), 'r')
+            source = ffile.read()
+            ffile.close()
+        except IOError:
+            source = ''
+        __SOURCE_SHA = hashlib.sha1(source).hexdigest()
+    return __SOURCE_SHA
+
+def __cache_fingerprint(args, config, ext):
+    '''
+    Takes a parser object, a config dictionary, and the extension of a file,
+    and returns a string identifying everything other than the contents of
+    the file which the warnings for the file depend on: the configuration
+    values, the maximum number of warnings the Linter stops at (see
+    __make_linter), the extension (which decides the rules that are applied),
+    and the source code of gaplint itself (standing in for its version).
+    '''
+    import json
+    return json.dumps([_get_config_val('columns', config),
+                       _get_config_val('indentation', config),
+                       _get_config_val('report_unused_args', config),
+                       args.max_warnings,
+                       sorted(_get_config_val('disable', config)),
+                       ext,
+                       _source_sha()])
+
+def __cache_key(fingerprint, lines):
+    '''
+    Takes the cache fingerprint of the run, and the lines of a file, and
+    returns the name of the cache entry for the file.
+    '''
+    import hashlib
+    sha = hashlib.sha1(fingerprint)
+    for line in lines:
+        sha.update(line)
+    return sha.hexdigest()
+
+def __cache_get(key, fname):
+    '''
+    Takes a cache key and a filename, and returns the LintResult stored under
+    the key in _CACHE_DIR, or None if there is no such entry.
+    '''
+    import json
+    path = os.path.join(_CACHE_DIR, key + '.json')
+    try:
+        ffile = open(path, 'r')
+        entry = json.load(ffile)
+        ffile.close()
+        os.utime(path, None) # so that recently used entries are kept
+    except (IOError, OSError, ValueError):
+        return None
+    result = LintResult(fname)
+    result.nr_lines = entry['nr_lines']
+    result.warnings = [(i, msg.encode('utf-8'), code.encode('utf-8'), col)
+                       for i, msg, code, col in entry['warnings']]
+    result.notes = [(i, msg.encode('utf-8')) for i, msg in entry['notes']]
+    result.abort = entry['abort']
+    result.checked = entry['checked']
+    return result
+
+def __cache_put(key, result):
+    '''
+    Takes a cache key and a LintResult, and stores the result in _CACHE_DIR.
+    Failing to write the cache is not an error.
+    '''
+    import json
+    entry = {'nr_lines': result.nr_lines, 'warnings': result.warnings,
+             'notes': result.notes, 'abort': result.abort,
+             'checked': result.checked}
+    path = os.path.join(_CACHE_DIR, key + '.json')
+    tmp_path = path + '.' + str(os.getpid())
+    try:
+        if not os.path.isdir(_CACHE_DIR):
+            os.makedirs(_CACHE_DIR)
+        ffile = open(tmp_path, 'w')
+        json.dump(entry, ffile)
+        ffile.close()
+        os.rename(tmp_path, path) # atomic, other processes never see half
+    except (IOError, OSError):
+        pass
 
-def __set_suppression_dics(file_list):
+def __cache_evict():
     '''
-    Takes a list of files to be linted. Assigns a 3D dictionary to the global 
-    variable __SUPPRESSIONS. It's keys are the files to be linted. Each
-    corresponding value is a 2D dictionary containing the suppressions for each
-    line (that returned by suppressions_all_lines above)
+    Removes the least recently used entries in _CACHE_DIR, so that it contains
+    at most _CACHE_MAX_ENTRIES entries.
     '''
-    assert (isinstance(file_list, list)
-            and all(isinstance(x, str) for x in file_list))    
-    global __SUPPRESSIONS, __GLOBAL_SUPPRESSIONS
-    dic = {} # hold the suppressions of each line of each file
-    G_dic = {} # hole the global suppressions of each file
-    for fname in file_list: # for each file to be linted
-        lines = []
+    try:
+        entries = [os.path.join(_CACHE_DIR, x) for x in os.listdir(_CACHE_DIR)]
+    except OSError:
+        return
+    if len(entries) <= _CACHE_MAX_ENTRIES:
+        return
+    mtimes = []
+    for path in entries:
+        try:
+            mtimes.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    mtimes.sort()
+    for mtime, path in mtimes[:len(mtimes) - _CACHE_MAX_ENTRIES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+################################################################################
+# Linting files
+################################################################################
+
+class LintResult(object):
+    '''
+    The result of linting a single file.
+
+    Attributes:
+        fname    (str) : the name of the file
+        nr_lines (int) : the number of lines in the file
+        warnings (list): tuples (linenum, msg, code, col) of warnings, in the
+                         order found, where code is the code of the rule, and
+                         col is the (0-based) column of the warning, or None
+                         if it is not known
+        verbose  (list): pairs (linenum, line) of processed lines, only
+                         collected in verbose mode
+        notes    (list): pairs (linenum, msg) of warnings about the
+                         suppressions in the file, these are not counted
+        abort    (bool): indicating if the last warning aborts the script
+        checked  (bool): indicating if any rule was applied to the file
+        profile  (dict): None, or if the Linter profiles the rules, a
+                         dictionary with keys 'lines' (the number of lines
+                         processed), 'seconds' (the time spent linting), and
+                         'rules', whose values are the dictionaries of
+                         _ProfiledRule.take_stats for the rules applied
+    '''
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.nr_lines = 0
+        self.warnings = []
+        self.verbose = []
+        self.notes = []
+        self.abort = False
+        self.checked = False
+        self.profile = None
+
+def __load_file(fname):
+    '''
+    Takes a filename and reads the file once. Returns the list of lines of the
+    file, or None if the file cannot be read.
+
+    This is called when linting of the file starts, and nothing is kept once
+    the file has been linted, so that memory use does not grow with the number
+    of files linted.
+    '''
+    try:
+        ffile = open(fname, 'r')
+        lines = ffile.readlines()
+        ffile.close()
+    except IOError:
+        _info_action('SKIPPING ' + fname + ': cannot open for reading')
+        return None
+    return lines
+
+def _col(raw, line, ro):
+    '''
+    Takes a line as it was read, the line given to a rule, and the RuleOutput
+    of the rule. Returns the column of the warning in the line as it was
+    read, or None if it is not known. This is only known if the rule was
+    given a prefix of the line read, since otherwise the position of the
+    warning in the line given to the rule is not the same as in the line read.
+    '''
+    if ro.col is not None and raw.startswith(line.rstrip('\n')):
+        return ro.col
+    return None
+
+class _ProfiledRule(object):
+    '''
+    Wraps a rule, and records the number of times it is called, the time
+    spent in those calls, and the number of warnings it returns. This is
+    only used by Linters which profile the rules, so that the rules are
+    not slowed down otherwise.
+
+    The wrapped rules are not combined into WarnRegexGroups, so that the time
+    spent in every rule is measured on its own.
+    '''
+    def __init__(self, rule):
+        self.rule = rule
+        self.name = rule.name
+        self.code = rule.code
+        self.calls = 0
+        self.seconds = 0.0
+        self.warnings = 0
+        import timeit
+        self._timer = timeit.default_timer
+
+    def __call__(self, line):
+        start = self._timer()
+        ro = self.rule(line)
+        self.seconds += self._timer() - start
+        self.calls += 1
+        if ro.msg:
+            self.warnings += 1
+        return ro
+
+    def reset(self):
+        self.rule.reset()
+
+    def skip(self, ext):
+        return self.rule.skip(ext)
+
+    def take_stats(self):
+        '''
+        Returns a dictionary with keys 'calls', 'seconds', and 'warnings' of
+        the calls since the last call to this method, and resets them.
+        '''
+        stats = {'calls': self.calls, 'seconds': self.seconds,
+                 'warnings': self.warnings}
+        self.calls, self.seconds, self.warnings = 0, 0.0, 0
+        return stats
+
+class Linter(object):
+    '''
+    Lints files, or source code, and returns the warnings found as LintResult
+    objects. Nothing is written, and nothing exits, so that a Linter can be
+    used from other Python code, and be kept to lint many files in a long
+    running process. Every Linter has its own configuration and instances of
+    the rules, so several Linters (with different configurations) can be used
+    at the same time, but a single Linter should only be used by one thread at
+    a time.
+
+    Keyword Args:
+        max_warnings (int): the maximum number of warnings in a file, after
+                            which linting the file stops (defaults to 1000)
+        columns (int):      max characters per line (defaults to 80)
+        indentation (int):  indentation of nested statements (defaults to 2)
+        report_unused_args (bool): also report unused function arguments
+                            (defaults to False)
+        disable (list):     rules (names/codes) to disable (defaults to [])
+        verbose (bool):     collect the processed lines (defaults to False)
+        profile (bool):     record the time spent in, and the warnings
+                            returned by, every rule in LintResult.profile
+                            (defaults to False)
+
+    The defaults are the configured values, see _get_config_val.
+    '''
+    def __init__(self, max_warnings=None, columns=None, indentation=None,
+                 disable=None, verbose=False, profile=False,
+                 report_unused_args=None):
+        if max_warnings is None:
+            max_warnings = _get_config_val('max_warnings')
+        if columns is None:
+            columns = _get_config_val('columns')
+        if indentation is None:
+            indentation = _get_config_val('indentation')
+        if disable is None:
+            disable = _get_config_val('disable')
+        self.max_warnings = max_warnings
+        self.disable = _make_code_list(list(disable))
+        self.verbose = verbose
+        self.profile = profile
+        self.rules = _make_rules(columns, indentation, report_unused_args)
+        self._position = _Position()
+        for rule in self.rules:
+            rule.position = self._position
+        if profile:
+            self.rules = [_ProfiledRule(rule) for rule in self.rules]
+        self._groups = {} # codes -> WarnRegexGroup, see __group_warn_regexes
+        self._remove_prefix = RemovePrefix()
+
+    def lint_file(self, fname, changed=None):
+        '''
+        Takes a filename, and returns the LintResult of linting the file. See
+        lint_lines for changed. Raises IOError if the file cannot be read.
+        '''
+        ffile = open(fname, 'r')
         try:
-            ffile = open(fname, 'r')
             lines = ffile.readlines()
+        finally:
             ffile.close()
-        except IOError: ### not sure how exceptions should be handled here
-            pass    
-        # assign suppressions for each line of a file
-        lines_suppdic = __get_lines_suppdic(fname, lines)
-        # assign global suppressions for a file
-        global_suppdic = __get_global_suppdic(fname, lines)
-        if len(lines_suppdic.keys()) > 0: # if a file has line suppressions
-            dic[fname] = __get_lines_suppdic(fname, lines)
-        if len(global_suppdic.keys()) > 0: # if a file has global suppressions
-            G_dic[fname] = __get_global_suppdic(fname, lines)
-    __SUPPRESSIONS = dic
-    __GLOBAL_SUPPRESSIONS = G_dic
-
-def __get_suppression_dic(choice):
-    '''
-    Takes the string 'lines' or 'global'. In the case of the former, returns the
-    contents of the global variable __SUPPRESSIONS. In the case of the latter,
-    returns the contents of the global variable, __GLOBAL_SUPPRESSIONS.
-    '''
-    assert (choice == 'lines' or choice == 'global')
-    global __SUPPRESSIONS, __GLOBAL_SUPPRESSIONS
-    if choice == 'lines':
-        return __SUPPRESSIONS
-    return __GLOBAL_SUPPRESSIONS
-
-def __is_rule_suppressed(fname, linenum, code):
-    '''
-    Takes a filename, line number and rule code. First checks 
-    __GLOBAL_SUPPRESSIONS to check if the rule is suppressed for the whole file.
-    If not, it checks __SUPPRESSIONS to check if the rule is suppressed for the 
-    line in the file. Returns True if suppressed, False if not.
-    '''
-    assert (all(isinstance(x, str) for x in [fname, code]) 
-            and isinstance(linenum, int))
-    g_supps = __get_suppression_dic('global') # __GLOBAL_SUPPRESSIONS
-    if fname in g_supps.keys():
-        return code in g_supps[fname].keys()
-    l_supps = __get_suppression_dic('lines') # __SUPPRESSIONS
-    if fname in l_supps.keys():
-        if linenum in l_supps[fname].keys():
-            return code in l_supps[fname][linenum].keys()
-    return False
+        return self.lint_lines(lines, fname, changed=changed)
 
+    def lint_source(self, source, fname='<source>', ext=None, changed=None):
+        '''
+        Takes a string containing the contents of a file, and returns the
+        LintResult of linting it. See lint_lines for the other arguments.
+        '''
+        return self.lint_lines(source.splitlines(True), fname, ext, changed)
+
+    def lint_lines(self, lines, fname='<source>', ext=None, changed=None):
+        '''
+        Takes a list of the lines (str, including the newlines) of a file, and
+        returns the LintResult of linting them. The lines are linted as if
+        they were the contents of the file fname, whose extension ext (such as
+        'g' or 'tst') determines the rules applied, it defaults to the
+        extension of fname. If changed is not None, then only warnings in the
+        lines whose (0-based) indices are in changed are reported, except for
+        warnings that abort.
+
+        At most max_warnings warnings are collected, since any more would
+        abort the script anyway.
+        '''
+        result = LintResult(fname)
+        result.nr_lines = len(lines)
+        global_suppdic, lines_suppdic = _get_suppdics(fname, lines,
+                                                      result.notes)
+        if ext is None:
+            ext = fname.split('.')[-1]
+        rules, line_rules = _get_rule_plan(self.rules, self.disable, ext,
+                                           global_suppdic, lines_suppdic,
+                                           self._groups)
+        self._lint(((i, line, line_rules.get(i, rules))
+                    for i, line in enumerate(lines)), ext, changed, result)
+        return result
+
+    def lint_iter(self, lines, fname='<stdin>', ext=None, changed=None):
+        '''
+        Takes an iterable of the lines (str, including the newlines) of a
+        file, such as sys.stdin, and returns the LintResult of linting them.
+        See lint_lines for the other arguments.
+
+        The lines are read one at a time, and are not kept, so that the memory
+        used does not depend on the number of lines. Only the lines at the
+        start of the file up to the first line of code are read before any
+        line is linted, since they can contain suppressions for the whole file.
+        '''
+        result = LintResult(fname)
+        if ext is None:
+            ext = fname.split('.')[-1]
+        lines = iter(lines)
+        header = []
+        for line in lines:
+            header.append(line)
+            if not _SUPP_HEADER_PATTERN.search(line):
+                break
+        global_suppdic, lines_suppdic = _get_suppdics(fname, header,
+                                                      result.notes)
+        self._lint(self._stream_plan(header, lines, fname, ext,
+                                     global_suppdic, lines_suppdic, result),
+                   ext, changed, result)
+        return result
+
+    def _stream_plan(self, header, lines, fname, ext, global_suppdic,
+                     lines_suppdic, result):
+        '''
+        Yields the triples (i, line, rules) for lint_iter, where rules are the
+        rules to apply to the line with index i. The suppressions in the lines
+        after the header are found when the lines are read.
+        '''
+        rules = _get_rule_plan(self.rules, self.disable, ext, global_suppdic,
+                               {}, self._groups)[0]
+        # as in _get_suppdics, if all rules are suppressed for the whole file,
+        # then the suppressions in the lines are ignored
+        find_suppressions = len(global_suppdic) < len(self.rules)
+        for i, line in enumerate(itertools.chain(header, lines)):
+            result.nr_lines = i + 1
+            if i >= len(header) and find_suppressions and 'gaplint' in line:
+                is_nextline, codes = _get_line_suppressions(fname, line, i,
+                                                            result.notes)
+                if codes:
+                    lines_suppdic.setdefault(i + is_nextline, {}).update(codes)
+            if i in lines_suppdic:
+                yield i, line, _get_rule_plan(self.rules, self.disable, ext,
+                                              global_suppdic,
+                                              {i: lines_suppdic.pop(i)},
+                                              self._groups)[1][i]
+            else:
+                yield i, line, rules
+
+    def _lint(self, plan, ext, changed, result):
+        '''
+        Takes an iterable of triples (i, line, rules), applies the rules to
+        the line with index i, and records the warnings in result.
+        '''
+        if self.profile:
+            result.profile = {'lines': 0}
+            plan = self._count_lines(plan, result.profile)
+            import timeit
+            timer = timeit.default_timer
+            start = timer()
+        try:
+            self._lint_plan(plan, ext, changed, result)
+        finally:
+            for rule in self.rules:
+                rule.reset()
+            self._remove_prefix.reset()
+            if self.profile:
+                result.profile['seconds'] = timer() - start
+                result.profile['rules'] = dict((rule.code, rule.take_stats())
+                                               for rule in self.rules
+                                               if rule.calls > 0)
+
+    @staticmethod
+    def _count_lines(plan, profile):
+        '''
+        Yields the triples of plan, and counts them in profile['lines'].
+        '''
+        for triple in plan:
+            profile['lines'] += 1
+            yield triple
+
+    def _lint_plan(self, plan, ext, changed, result):
+        max_warnings = self.max_warnings
+        position = self._position
+        for i, line, rules in plan:
+            position.index = i
+            raw = line.rstrip('\n')
+            line = self._remove_prefix(line, ext)
+            for rule in rules:
+                try:
+                    ro = rule(line)
+                except AssertionError as e:
+                    raise AssertionError('Assertion in ' + result.fname + ':'
+                                         + str(i + 1) + ' ' + str(e))
+
+                result.checked = True
+                if isinstance(rule, WarnRegexGroup):
+                    if changed is None or i in changed:
+                        result.warnings.extend(
+                            (i, x[1].msg, x[0].code, _col(raw, line, x[1]))
+                            for x in ro)
+                    if len(result.warnings) >= max_warnings:
+                        del result.warnings[max(max_warnings, 1):]
+                        return
+                    continue
+                assert isinstance(ro, RuleOutput)
+                if ro.msg and (changed is None or i in changed or ro.abort):
+                    result.warnings.append((i, ro.msg, rule.code,
+                                            _col(raw, line, ro)))
+                if ro.abort:
+                    result.abort = True
+                    return
+                line = ro.line
+                if len(result.warnings) >= max_warnings:
+                    return
+            if self.verbose:
+                result.verbose.append((i, line))
+
+__LINTERS = {}
+
+def __make_linter(args, config):
+    '''
+    Takes a parser object and a config dictionary, and returns a Linter with
+    the configuration. The Linters are kept, so that a process which runs
+    gaplint many times (such as the server), or lints files with different
+    configurations, does not create the rules again for every file.
+    '''
+    key = (args.max_warnings, _get_config_val('columns', config),
+           _get_config_val('indentation', config),
+           tuple(_get_config_val('disable', config)),
+           not _SILENT and _VERBOSE, args.profile_rules is not None,
+           _get_config_val('report_unused_args', config))
+    if not key in __LINTERS:
+        __LINTERS[key] = Linter(max_warnings=key[0], columns=key[1],
+                                indentation=key[2], disable=key[3],
+                                verbose=key[4], profile=key[5],
+                                report_unused_args=key[6])
+    return __LINTERS[key]
+
+def __lint_stdin(args):
+    '''
+    Takes a parser object, and returns the LintResult of linting the lines
+    read from stdin as if they were the file args.stdin_filename. The lines
+    are linted as they are read, and are not cached.
+    '''
+    fname = args.stdin_filename
+    if not _has_valid_extension(fname):
+        _info_action('IGNORING ' + fname + ': not a valid file extension')
+        return LintResult(fname)
+    linter = __make_linter(args, __get_file_config(args, fname))
+    return linter.lint_iter(iter(sys.stdin.readline, ''), fname)
+
+def __lint_file(args, fname):
+    '''
+    Takes a parser object and a filename, lints the file with its
+    configuration, and returns a LintResult. Nothing is written here, so that
+    this can be run in a worker process, the output is produced by
+    __emit_result.
+    '''
+    lines = __load_file(fname)
+    if lines is None:
+        return LintResult(fname)
+
+    # The lines (if any) that warnings are reported for
+    changed = args.changed_lines.get(fname) if args.changed_lines else None
+    config = __get_file_config(args, fname)
+
+    cache_key = None
+    if args.use_cache:
+        fingerprint = __cache_fingerprint(args, config, fname.split('.')[-1])
+        if changed is not None:
+            fingerprint += repr(sorted(changed))
+        cache_key = __cache_key(fingerprint, lines)
+        cached = __cache_get(cache_key, fname)
+        if cached is not None:
+            return cached
+
+    result = __make_linter(args, config).lint_lines(lines, fname,
+                                                    changed=changed)
+    if cache_key is not None:
+        __cache_put(cache_key, result)
+    return result
+
+# The files are sent to the workers in chunks of this many files, so that
+# there are fewer round trips between the processes for many small files.
+_POOL_CHUNKSIZE = 8
+__WORKER_ARGS = None # the parser object of a worker process
+
+def __lint_file_job(fname):
+    '''
+    Wrapper around __lint_file for multiprocessing.Pool.imap. Only the
+    filename is sent to the worker for every file, the parser object is sent
+    once, to __init_worker, since it contains the list of all the files.
+    '''
+    return __lint_file(__WORKER_ARGS, fname)
+
+def __init_worker(config, silent, verbose, args):
+    '''
+    Initialiser for the worker processes used when linting files in parallel,
+    so that the workers use the same configuration as the parent process.
+    '''
+    global __CONFIG, _SILENT, _VERBOSE, _FORMAT, _COLOUR, __WORKER_ARGS
+    __CONFIG = config
+    __WORKER_ARGS = args
+    _SILENT, _VERBOSE, _FORMAT = silent, verbose, args.format
+    _COLOUR = args.colour
+
+def __lint_files(args):
+    '''
+    Takes a parser object and yields a LintResult for every file yielded by
+    __iter_files, in that order. If args.jobs > 1, then the files are linted by
+    a pool of args.jobs worker processes.
+
+    Closing the generator cancels the linting of the remaining files, no more
+    files are linted (or found) after that. The old cache entries are removed
+    when the generator is exhausted or closed.
+    '''
+    __load_user_preferences(args) # config and suppressions for run
+
+    # The processed lines of a file, and the time spent linting it, are not
+    # cached, so do not use the cache in verbose mode, or when profiling.
+    args.use_cache = (args.cache and not _VERBOSE
+                      and args.profile_rules is None)
+
+    try:
+        if args.stdin_filename is not None:
+            yield __lint_stdin(args)
+
+        if args.jobs <= 1 or (len(args.files) <= 1
+                              and not any(os.path.isdir(x)
+                                          for x in args.files)):
+            for fname in __iter_files(args):
+                yield __lint_file(args, fname)
+        else:
+            results = __lint_files_in_pool(args)
+            try:
+                for result in results:
+                    yield result
+            finally:
+                results.close() # terminates the workers if linting stops
+    finally: # also if linting stops early, when the generator is closed
+        if args.use_cache:
+            __cache_evict()
+
+def __lint_files_in_pool(args):
+    '''
+    Takes a parser object and yields a LintResult for every file yielded by
+    __iter_files, in that order, linted by a pool of args.jobs worker
+    processes.
+    '''
+    nr_processes = args.jobs
+    if not any(os.path.isdir(x) for x in args.files):
+        nr_processes = min(nr_processes, len(args.files))
+    import multiprocessing # only imported if it is used, since it is slow
+    pool = multiprocessing.Pool(nr_processes, __init_worker,
+                                (__CONFIG, _SILENT, _VERBOSE, args))
+    try:
+        for result in pool.imap(__lint_file_job, __iter_files(args),
+                                _POOL_CHUNKSIZE):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def __emit_result(result, total_nr_warnings, args, writer):
+    '''
+    Takes a LintResult, the number of warnings in the files linted before it,
+    a parser object, and the writer of the output format (or None for text).
+    Writes the warnings (and processed lines in verbose mode) in the order
+    they were found. Returns a pair, whose first entry is the new total number
+    of warnings, and whose second entry is None, or the reason (str) for
+    stopping, if no more files should be linted, because there are too many
+    warnings, the last warning aborts, or args.fail_fast is True and the file
+    has warnings.
+    '''
+    # as in a serial run, no warnings are written after the first
+    # args.max_warnings, and the last of them only aborts if it is written
+    remaining = args.max_warnings - total_nr_warnings
+    if len(result.warnings) > remaining:
+        del result.warnings[max(remaining, 0):]
+        result.abort = False
+    sink = _OutputSink() # everything about the file is written at once
+    for linenum, msg in result.notes:
+        _info_warn(result.fname, linenum, msg, sink=sink)
+    warnings = result.warnings
+    nr_warnings = len(warnings)
+    if writer is not None:
+        writer.write_result(result)
+        for i, line in result.verbose:
+            _info_verbose(result.fname, i, line, sink=sink)
+    elif not _SILENT:
+        pad_lines = [None] * result.nr_lines # only the length is used by _pad
+        j = 0
+        for i, line in result.verbose:
+            while j < nr_warnings and warnings[j][0] <= i:
+                _info_warn(result.fname, warnings[j][0], warnings[j][1],
+                           _pad(pad_lines, warnings[j][0]), sink)
+                j += 1
+            _info_verbose(result.fname, i, line, _pad(pad_lines, i), sink)
+        for warning in warnings[j:]:
+            _info_warn(result.fname, warning[0], warning[1],
+                       _pad(pad_lines, warning[0]), sink)
+    sink.flush()
+
+    total_nr_warnings += nr_warnings
+    if result.abort and (nr_warnings == 0
+                         or total_nr_warnings - 1 < args.max_warnings):
+        return total_nr_warnings, str(total_nr_warnings) + ' warnings'
+    if ((nr_warnings > 0 or result.checked)
+            and total_nr_warnings >= args.max_warnings):
+        return total_nr_warnings, 'too many warnings'
+    if args.fail_fast and nr_warnings > 0:
+        return total_nr_warnings, 'warnings in ' + result.fname
+    return total_nr_warnings, None
 
 ################################################################################
-# user preferences
+# Output formats
 ################################################################################
 
-def __is_rule_disabled_or_suppressed(args, fname, linenum, code):
+def _warning_dic(fname, warning):
     '''
-    Takes a filename, line number and rule code. Returns True if the rule is
-    suppressed for that particular line, and False otherwise.
+    Takes a filename and a warning (as in LintResult.warnings), and returns a
+    dictionary describing the warning, with 1-based line and column numbers.
     '''
-    global __USER_PREFERENCES_LOADED
-    assert (all(isinstance(x, str) for x in [fname, code]) 
-            and isinstance(linenum, int))
-    if not __USER_PREFERENCES_LOADED:
-        __load_user_preferences(args) # config and suppressions for run
-        __USER_PREFERENCES_LOADED = True
-    if code in _get_config_val('disable'):
-        return True       
-    if __is_rule_suppressed(fname, linenum, code):
-        return True
-    return False
+    linenum, msg, code, col = warning
+    return {'file': fname, 'line': linenum + 1,
+            'column': None if col is None else col + 1, 'code': code,
+            'rule': _RULE_NAMES.get(code), 'message': msg}
 
-def __load_user_preferences(args):
+class _JSONLinesWriter(object):
     '''
-    Takes a parser object as argument and populates the global variables 
-    __CONFIG, __SUPPRESSIONS and __GLOBAL suppressions based on user 
-    preferences.
+    Writes the warnings to a stream as JSON objects (see _warning_dic), one
+    per line. The warnings of a file are written with a single write.
     '''
-    assert isinstance(args, object)
-    __set_user_config_dic(args)
-    __set_suppression_dics(args.files)
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write_result(self, result):
+        import json
+        if result.warnings:
+            self._stream.write(''.join(
+                json.dumps(_warning_dic(result.fname, w), sort_keys=True)
+                + '\n' for w in result.warnings))
+
+    def finish(self):
+        self._stream.flush()
+
+class _JSONWriter(object):
+    '''
+    Writes the warnings to a stream as a JSON array of objects (see
+    _warning_dic). The array is written as the files are linted, and is
+    closed by finish.
+    '''
+    def __init__(self, stream):
+        self._stream = stream
+        self._sep = '[\n'
+
+    def write_result(self, result):
+        import json
+        out = []
+        for w in result.warnings:
+            out.append(self._sep)
+            out.append(json.dumps(_warning_dic(result.fname, w),
+                                  sort_keys=True))
+            self._sep = ',\n'
+        self._stream.write(''.join(out))
+
+    def finish(self):
+        self._stream.write('[]\n' if self._sep == '[\n' else '\n]\n')
+        self._stream.flush()
+
+class _SARIFWriter(object):
+    '''
+    Writes the warnings to a stream as a SARIF 2.1.0 log with a single run.
+    The results are written as the files are linted, and the log is closed by
+    finish.
+    '''
+    def __init__(self, stream):
+        self._stream = stream
+        self._sep = ''
+        import json
+        rules = [{'id': rule.code, 'name': rule.name}
+                 for rule in RULES if rule.code.startswith('W')]
+        header = json.dumps({'$schema': 'https://json.schemastore.org/'
+                                        + 'sarif-2.1.0.json',
+                             'version': '2.1.0',
+                             'runs': [{'tool': {'driver': {
+                                 'name': 'gaplint', 'rules': rules}},
+                                       'results': []}]}, sort_keys=True)
+        # everything after the (empty) list of results is written by finish
+        index = header.rindex('"results": []') + len('"results": [')
+        self._stream.write(header[:index] + '\n')
+        self._tail = header[index:]
+
+    def write_result(self, result):
+        import json
+        out = []
+        for linenum, msg, code, col in result.warnings:
+            region = {'startLine': linenum + 1}
+            if col is not None:
+                region['startColumn'] = col + 1
+            out.append(self._sep)
+            out.append(json.dumps({
+                'ruleId': code, 'level': 'warning', 'message': {'text': msg},
+                'locations': [{'physicalLocation': {
+                    'artifactLocation': {'uri': result.fname},
+                    'region': region}}]}, sort_keys=True))
+            self._sep = ',\n'
+        self._stream.write(''.join(out))
+
+    def finish(self):
+        self._stream.write('\n' + self._tail + '\n')
+        self._stream.flush()
+
+class _CheckstyleWriter(object):
+    '''
+    Writes the warnings to a stream as checkstyle XML, with one file element
+    per file with warnings. The document is closed by finish.
+    '''
+    def __init__(self, stream):
+        import xml.sax.saxutils # only imported if it is used, since it is slow
+        self._quoteattr = xml.sax.saxutils.quoteattr
+        self._stream = stream
+        self._stream.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                           + '<checkstyle version="4.3">\n')
+
+    def write_result(self, result):
+        if not result.warnings:
+            return
+        out = ['<file name=' + self._quoteattr(result.fname)
+               + '>\n']
+        for linenum, msg, code, col in result.warnings:
+            out.append('<error line="' + str(linenum + 1) + '"'
+                       + ('' if col is None
+                          else ' column="' + str(col + 1) + '"')
+                       + ' severity="warning" message='
+                       + self._quoteattr(msg)
+                       + ' source="gaplint.' + code + '"/>\n')
+        out.append('</file>\n')
+        self._stream.write(''.join(out))
+
+    def finish(self):
+        self._stream.write('</checkstyle>\n')
+        self._stream.flush()
+
+_WRITERS = {'json': _JSONWriter, 'jsonl': _JSONLinesWriter,
+            'sarif': _SARIFWriter, 'checkstyle': _CheckstyleWriter}
+
+################################################################################
+# Profiling the rules
+################################################################################
+
+class _RuleProfile(object):
+    '''
+    Collects the profiles (see LintResult.profile) of the files linted in a
+    run, possibly by several worker processes, and writes them at the end.
+    '''
+    def __init__(self):
+        self.rules = {}
+        self.files = []
+
+    def add(self, result):
+        '''
+        Takes a LintResult, and adds its profile (if any) to the totals.
+        '''
+        if result.profile is None:
+            return
+        for code, stats in result.profile['rules'].iteritems():
+            totals = self.rules.setdefault(code, {'calls': 0, 'seconds': 0.0,
+                                                  'warnings': 0})
+            for key in totals:
+                totals[key] += stats[key]
+        self.files.append({'file': result.fname,
+                           'lines': result.profile['lines'],
+                           'warnings': len(result.warnings),
+                           'seconds': result.profile['seconds']})
+
+    def to_dic(self):
+        '''
+        Returns a dictionary with keys 'rules' and 'files', whose values are
+        lists of dictionaries, sorted by the time spent, most first.
+        '''
+        rules = [dict(stats, code=code, rule=_RULE_NAMES.get(code))
+                 for code, stats in self.rules.iteritems()]
+        rules.sort(key=lambda x: (-x['seconds'], x['code']))
+        files = sorted(self.files, key=lambda x: (-x['seconds'], x['file']))
+        return {'rules': rules, 'files': files}
+
+    def write(self, stream, fmt, nr_files=10):
+        '''
+        Writes the profile to stream, as JSON if fmt is 'json', and otherwise
+        as tables of the rules, and of the nr_files slowest files.
+        '''
+        dic = self.to_dic()
+        if fmt == 'json':
+            import json
+            stream.write(json.dumps(dic, sort_keys=True) + '\n')
+            return
+        out = ['%-6s %-30s %10s %10s %10s %10s\n'
+               % ('code', 'rule', 'calls', 'seconds', 'usec/call',
+                  'warnings')]
+        for x in dic['rules']:
+            out.append('%-6s %-30s %10d %10.4f %10.2f %10d\n'
+                       % (x['code'], x['rule'], x['calls'], x['seconds'],
+                          x['seconds'] * 1e6 / max(x['calls'], 1),
+                          x['warnings']))
+        out.append('\n%10s %10s %10s  %s\n'
+                   % ('lines', 'warnings', 'seconds', 'file'))
+        for x in dic['files'][:nr_files]:
+            out.append('%10d %10d %10.4f  %s\n'
+                       % (x['lines'], x['warnings'], x['seconds'], x['file']))
+        out.append('%10d %10d %10.4f  total (%d files)\n'
+                   % (sum(x['lines'] for x in dic['files']),
+                      sum(x['warnings'] for x in dic['files']),
+                      sum(x['seconds'] for x in dic['files']),
+                      len(dic['files'])))
+        stream.write(''.join(out))
+
+################################################################################
+# Server
+################################################################################
+
+class _OutputRecorder(object):
+    '''
+    This is a file-like object which records the output written to it, so that
+    the output written to stdout and stderr while a request is linted by the
+    server can be replayed in the same order by the client.
+
+    Attributes:
+        output (list): pairs (stream, text) where stream is 1 (stdout) or 2
+                       (stderr), and text is the text written
+        stream (int) : the stream written to
+        tty    (bool): whether the stream of the client is a terminal
+    '''
+    def __init__(self, output, stream, tty=False):
+        self.output = output
+        self.stream = stream
+        self.tty = tty
+
+    def isatty(self):
+        return self.tty
+
+    def write(self, text):
+        # latin-1 makes any bytes (such as the lines of a file) valid JSON
+        self.output.append((self.stream, text.decode('latin-1')))
+
+    def flush(self):
+        pass
+
+def _run_request(argv, cwd, stdin, tty=(False, False)):
+    '''
+    Takes the command line arguments, current directory, and the contents of
+    stdin (or None) of a client, and a pair indicating if its stdout and
+    stderr are terminals. Runs gaplint with them in this process, and returns
+    the pair (output, status), where output is as in _OutputRecorder, and
+    status is the exit status.
+    '''
+    import StringIO
+    import traceback
+    output = []
+    saved = (sys.argv, sys.stdout, sys.stderr, sys.stdin, os.getcwd())
+    sys.argv = ['gaplint'] + argv
+    sys.stdin = StringIO.StringIO(stdin or '')
+    sys.stdout = _OutputRecorder(output, 1, tty[0])
+    sys.stderr = _OutputRecorder(output, 2, tty[1])
+    try:
+        os.chdir(cwd)
+        run_gaplint()
+        status = 0
+    except SystemExit as e:
+        status = e.code
+        if status is None:
+            status = 0
+        elif not isinstance(status, int):
+            sys.stderr.write(str(status) + '\n')
+            status = 1
+    except Exception: #pylint: disable=broad-except
+        sys.stderr.write(traceback.format_exc())
+        status = 1
+    finally:
+        sys.argv, sys.stdout, sys.stderr, sys.stdin = saved[:4]
+        os.chdir(saved[4])
+    return output, status
+
+def _handle_request(rfile, wfile):
+    '''
+    Handles a request to the server: reads a line containing a JSON object
+    with keys argv, cwd, stdin and tty from rfile, and writes the reply, a
+    JSON object with keys output and status (see _run_request), to wfile.
+    '''
+    import json
+    request = json.loads(rfile.readline())
+    stdin = request.get('stdin')
+    if stdin is not None:
+        stdin = stdin.encode('latin-1')
+    output, status = _run_request([x.encode('utf-8') for x in request['argv']],
+                                  request['cwd'].encode('utf-8'), stdin,
+                                  request.get('tty', (False, False)))
+    wfile.write(json.dumps({'output': output, 'status': status}))
+
+def __default_socket():
+    '''
+    Returns the path of the default socket of the server: gaplint.sock in
+    $XDG_RUNTIME_DIR, or else in a directory only the user can access in the
+    temporary directory, so that nobody else can create the socket before the
+    server does.
+    '''
+    dir_path = os.environ.get('XDG_RUNTIME_DIR')
+    if not dir_path:
+        import tempfile # only imported if it is used, since it probes the disk
+        dir_path = os.path.join(tempfile.gettempdir(),
+                                'gaplint-' + str(os.getuid()))
+    return os.path.join(dir_path, 'gaplint.sock')
+
+def __serve(path):
+    '''
+    Takes the path of a Unix domain socket (or None for the default socket),
+    and lints the files requested by clients connecting to it, until the
+    process is killed. The requests are handled one at a time, in this
+    process, so that the rules, and any caches, are kept between requests.
+    '''
+    import socket # only imported if it is used, since it is slow
+    import SocketServer
+
+    class RequestHandler(SocketServer.StreamRequestHandler):
+        '''
+        Handles a request to the server, see _handle_request.
+        '''
+        def handle(self):
+            _handle_request(self.rfile, self.wfile)
+
+    is_default = path is None
+    if is_default:
+        path = __default_socket()
+    dir_path = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(dir_path):
+        try:
+            os.makedirs(dir_path, 0o700)
+        except OSError as e:
+            _exit_abort('cannot create ' + dir_path + ': ' + e.strerror)
+    if is_default:
+        st = os.lstat(dir_path)
+        if (st.st_uid != os.getuid() or not stat.S_ISDIR(st.st_mode)
+                or st.st_mode & 0o077):
+            _exit_abort(dir_path + ' is not a directory only you can access')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        _exit_abort('a server is already running on ' + path)
+    except socket.error:
+        pass
+    finally:
+        sock.close()
+    if os.path.exists(path):
+        os.remove(path) # left by a server which was killed
+    umask = os.umask(0o077) # only this user can send requests
+    try:
+        server = SocketServer.UnixStreamServer(path, RequestHandler)
+    finally:
+        os.umask(umask)
+    _info_statement('gaplint: serving on ' + path)
+    # so that the socket is removed when the server is killed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+def __forward_to_server(path, stdin):
+    '''
+    Takes the path of a Unix domain socket (or None for the default socket)
+    and the contents of stdin (or None if it is not used), and sends them, the
+    command line arguments (except --client) and the current directory to the
+    server listening on it, and writes its output. Returns the exit status of
+    the server run, or None if there is no server, or the socket does not
+    belong to this user (so that nobody else can receive the request, and
+    reply to it).
+    '''
+    import json
+    if path is None:
+        path = __default_socket()
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    if st.st_uid != os.getuid() or not stat.S_ISSOCK(st.st_mode):
+        _info_action('IGNORING ' + path + ': not a socket owned by you')
+        return None
+    import socket # only imported if it is used, since it is slow
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    try:
+        sock.sendall(json.dumps({'argv': [x for x in sys.argv[1:]
+                                          if x != '--client'],
+                                 'cwd': os.getcwd(),
+                                 'stdin': (None if stdin is None
+                                           else stdin.decode('latin-1')),
+                                 'tty': [sys.stdout.isatty(),
+                                         sys.stderr.isatty()]})
+                     + '\n')
+        chunks = []
+        chunk = sock.recv(65536)
+        while chunk:
+            chunks.append(chunk)
+            chunk = sock.recv(65536)
+    finally:
+        sock.close()
+    reply = json.loads(''.join(chunks))
+    for stream, text in reply['output']:
+        (sys.stdout if stream == 1 else sys.stderr).write(
+            text.encode('latin-1'))
+    return reply['status']
 
 ################################################################################
 # The main event
@@ -1254,65 +3181,86 @@ def run_gaplint(**kwargs): #pylint: disable=too-many-branches
     the keywords argument files.
 
     Keyword Args:
-        files (list):         a list of the filenames (str) of the files to lint
+        files (list):         a list of the filenames (str) of the files (and
+                              directories) to lint
         max_warnings (int):   the maximum number of warnings before giving up
                               (defaults to 1000)
+        fail_fast (bool):     stop after the first file with warnings
+                              (defaults to False)
         columns (int):        max characters per line (defaults to 80)
         indentation (int):    indentation of nested statements (defaults to 2)
+        report_unused_args (bool): also report unused function arguments
+                              (defaults to False)
         disable (list):       rules (names/codes) to suppress (defaults to [])
         silent (bool):        no output
         verbose (bool):       so much output you will not know what to do
+        cache (bool):         reuse and store the warnings for files in
+                              .gaplint_cache (defaults to False, unlike on
+                              the command line)
+        jobs (int):           number of files linted in parallel, 0 means one
+                              per CPU (defaults to 1)
+        stdin_filename (str): lint the lines read from stdin as if they were
+                              the contents of this file (files can then be
+                              omitted)
+        changed_since (str):  lint the files changed since this git ref, and
+                              the untracked files, instead of files
+        only_changed_lines (bool): only report warnings in the lines changed
+                              since changed_since (defaults to False)
+        profile_rules (str):  write the time spent in every rule and file to
+                              stderr at the end, as a 'table' or as 'json'
+                              (defaults to None, no profile)
     '''    
     args = _parse_args(kwargs)
+    if args.server:
+        __serve(args.socket)
+    if args.client:
+        stdin = None
+        if args.stdin_filename is not None:
+            stdin = sys.stdin.read()
+        status = __forward_to_server(args.socket, stdin)
+        if status is not None:
+            sys.exit(status)
+        args = _parse_args(dict(kwargs, client=False)) # no server, lint here
+        if stdin is not None:
+            import StringIO
+            sys.stdin = StringIO.StringIO(stdin)
 
     total_nr_warnings = 0
 
-    for fname in args.files:
-        try:
-            ffile = open(fname, 'r')
-            lines = ffile.readlines()
-            ffile.close()
-        except IOError:
-            _info_action('SKIPPING ' + fname + ': cannot open for reading')
-
-        ext = fname.split('.')[-1]
-        nr_warnings = 0
-        for i in xrange(len(lines)):
-            lines[i] = _remove_prefix(lines[i], ext)
-            for rule in RULES:
-                is_rule_supp = __is_rule_disabled_or_suppressed(args, 
-                                                                fname, 
-                                                                i, rule.code)
-                if (not rule.skip(ext)) and (not is_rule_supp):
-                    try:
-                        ro = rule(lines[i])
-                    except AssertionError:
-                        sys.stdout.write(
-                            _red_string('Assertion in ' + fname +
-                                        ':' + str(i + 1)) + '\n')
-                        raise
-
-                    assert isinstance(ro, RuleOutput)
-                    if ro.msg:
-                        nr_warnings += 1
-                        _info_warn(fname, i, ro.msg, _pad(lines, i))
-                    if ro.abort:
-                        _exit_abort(str(total_nr_warnings + nr_warnings)
-                                    + ' warnings')
-                    lines[i] = ro.line
-                    if total_nr_warnings + nr_warnings >= args.max_warnings:
-                        _exit_abort('too many warnings')
-            _info_verbose(fname, i, lines[i], _pad(lines, i))
-        for rule in RULES:
-            rule.reset()
-        total_nr_warnings += nr_warnings
-        if nr_warnings == 0:
-            _info_statement('SUCCESS in ' + fname)
+    writer = None
+    if args.format != 'text':
+        writer = _WRITERS[args.format](sys.stdout)
+    profile = _RuleProfile() if args.profile_rules is not None else None
+    stop_reason = None
+    results = __lint_files(args)
+    try:
+        for result in results:
+            if profile is not None:
+                profile.add(result)
+            total_nr_warnings, stop_reason = __emit_result(result,
+                                                           total_nr_warnings,
+                                                           args, writer)
+            if stop_reason is not None:
+                break
+            if len(result.warnings) == 0:
+                _info_statement('SUCCESS in ' + result.fname)
+    finally:
+        results.close() # the remaining files are not linted
+        if writer is not None:
+            writer.finish() # also when stopping, so the output is complete
+        if profile is not None:
+            profile.write(sys.stderr, args.profile_rules)
+    if stop_reason is not None:
+        if not _SILENT and total_nr_warnings != 0:
+            sys.stderr.write(_paint(_red_string, 'FAILED with '
+                                    + str(total_nr_warnings) + ' warnings!\n',
+                                    sys.stderr))
+        _exit_abort(stop_reason)
     if total_nr_warnings != 0:
         if not _SILENT:
-            sys.stderr.write(_red_string('FAILED with '
-                                         + str(total_nr_warnings)
-                                         + ' warnings!\n'))
+            sys.stderr.write(_paint(_red_string, 'FAILED with '
+                                    + str(total_nr_warnings) + ' warnings!\n',
+                                    sys.stderr))
             if __name__ == '__main__':
                 sys.exit(1)
     if __name__ == '__main__':
@@ -3,6 +3,14 @@
 import unittest
 import sys
 import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import StringIO
+import json
+import xml.dom.minidom
 
 path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if not path in sys.path:
@@ -25,9 +33,495 @@ class TestScript(unittest.TestCase):
         with self.assertRaises(SystemExit):
             run_gaplint(files=['tests/test3.g'], silent=True)
 
+    def test_dot_g_file4(self):
+        # test4.g contains 3 warnings that are not suppressed
+        run_gaplint(files=['tests/test4.g'], silent=True, max_warnings=4)
+        with self.assertRaises(SystemExit):
+            run_gaplint(files=['tests/test4.g'], silent=True, max_warnings=3)
+        run_gaplint(files=['tests/test4.g'], silent=True, max_warnings=3,
+                    disable='W002')
+
     def test_dot_tst_file(self):
         run_gaplint(files=['tests/test.tst'], silent=True)
 
+    def test_jobs(self):
+        run_gaplint(files=['tests/test.g', 'tests/test2.g', 'tests/test.tst'],
+                    jobs=2, silent=True)
+        with self.assertRaises(SystemExit):
+            run_gaplint(files=['tests/test.g', 'tests/test3.g'], jobs=2,
+                        silent=True)
+        with self.assertRaises(SystemExit):
+            run_gaplint(files=['tests/test.g', 'tests/test2.g'], jobs=2,
+                        max_warnings=3)
+
+    def test_max_warnings(self):
+        cwd, stdout = os.getcwd(), sys.stdout
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.chdir(tmpdir)
+            with open('a.g', 'w') as ffile:
+                ffile.write('a:=1;\nb:=2;\nc:=3;\n')
+            with open('b.g', 'w') as ffile:
+                ffile.write('a:=1;\nb:=2;\nc:=3;\nd:=4;\n')
+            for jobs in (1, 2):
+                # no more warnings than max_warnings, even if the limit is
+                # crossed in the middle of a file
+                sys.stdout = StringIO.StringIO()
+                with self.assertRaises(SystemExit):
+                    run_gaplint(files=['a.g', 'b.g'], max_warnings=5,
+                                format='json', jobs=jobs, cache=False)
+                warnings = json.loads(sys.stdout.getvalue())
+                self.assertEqual([(x['file'], x['line']) for x in warnings],
+                                 [('a.g', 1), ('a.g', 2), ('a.g', 3),
+                                  ('b.g', 1), ('b.g', 2)])
+        finally:
+            sys.stdout = stdout
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_fail_fast(self):
+        files = ['tests/test.tst', 'tests/test4.g', 'tests/test3.g']
+        run_gaplint(files=files[:1], fail_fast=True, silent=True)
+        stdout = sys.stdout
+        try:
+            for jobs in (1, 2):
+                sys.stdout = StringIO.StringIO()
+                with self.assertRaises(SystemExit):
+                    run_gaplint(files=files, fail_fast=True, format='json',
+                                jobs=jobs, cache=False)
+                warnings = json.loads(sys.stdout.getvalue())
+                self.assertEqual([x['file'] for x in warnings],
+                                 ['tests/test4.g'] * 3)
+        finally:
+            sys.stdout = stdout
+
+    def test_cache(self):
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for fname in ('test.g', 'test2.g', 'test4.g'):
+                shutil.copy(os.path.join('tests', fname), tmpdir)
+            os.chdir(tmpdir)
+            # the cache is only used from Python if it is asked for
+            run_gaplint(files=['test4.g'], max_warnings=4, silent=True)
+            self.assertFalse(os.path.exists('.gaplint_cache'))
+            for i in xrange(2): # the second time the warnings are cached
+                with self.assertRaises(SystemExit):
+                    run_gaplint(files=['test.g', 'test2.g'], max_warnings=3,
+                                silent=True, cache=True)
+                with self.assertRaises(SystemExit):
+                    run_gaplint(files=['test4.g'], max_warnings=3,
+                                silent=True, cache=True)
+                run_gaplint(files=['test4.g'], max_warnings=4, silent=True,
+                            cache=True)
+            self.assertTrue(os.listdir('.gaplint_cache'))
+            with self.assertRaises(SystemExit):
+                run_gaplint(files=['test4.g'], max_warnings=3, silent=True)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_cache_evict(self):
+        cwd, max_entries = os.getcwd(), gaplint._CACHE_MAX_ENTRIES
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for fname in ('a.g', 'b.g', 'c.g'):
+                shutil.copy('tests/test4.g', os.path.join(tmpdir, fname))
+            os.chdir(tmpdir)
+            for fname in ('b.g', 'c.g'): # so that the cache keys differ
+                with open(fname, 'a') as ffile:
+                    ffile.write('# ' + fname + '\n')
+            gaplint._CACHE_MAX_ENTRIES = 1
+            # the cache is evicted even if linting stops early
+            with self.assertRaises(SystemExit):
+                run_gaplint(files=['a.g', 'b.g', 'c.g'], max_warnings=7,
+                            silent=True, cache=True)
+            self.assertEqual(len(os.listdir('.gaplint_cache')), 1)
+        finally:
+            gaplint._CACHE_MAX_ENTRIES = max_entries
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_cache_key(self):
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shutil.copy('tests/test4.g', os.path.join(tmpdir, 'a.g'))
+            shutil.copy('tests/test4.g', os.path.join(tmpdir, 'a.tst'))
+            os.chdir(tmpdir)
+            # the result for a.g is not used for a.tst with the same lines
+            with self.assertRaises(SystemExit):
+                run_gaplint(files=['a.g'], max_warnings=3, silent=True,
+                            cache=True)
+            run_gaplint(files=['a.tst'], max_warnings=3, silent=True,
+                        cache=True)
+            # nor a result truncated at a smaller max_warnings
+            with self.assertRaises(SystemExit):
+                run_gaplint(files=['a.g'], max_warnings=2, silent=True,
+                            cache=True)
+            with self.assertRaises(SystemExit):
+                run_gaplint(files=['a.g'], max_warnings=3, silent=True,
+                            cache=True)
+            run_gaplint(files=['a.g'], max_warnings=4, silent=True,
+                        cache=True)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_changed_since(self):
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shutil.copy('tests/test4.g', os.path.join(tmpdir, 'a.g'))
+            os.chdir(tmpdir)
+            for git_args in (['init', '-q'], ['add', 'a.g'],
+                             ['-c', 'user.name=gaplint',
+                              '-c', 'user.email=gaplint', 'commit', '-q',
+                              '-m', 'a.g']):
+                subprocess.check_call(['git'] + git_args)
+            with open('a.g', 'a') as ffile:
+                ffile.write('v:=5;\n')
+            with open('b.g', 'w') as ffile:
+                ffile.write('u:=6;\n')
+            with open('c.txt', 'w') as ffile:
+                ffile.write('t:=7;\n')
+            self.assertEqual(gaplint.__dict__['__get_changed_files']('HEAD'),
+                             {'a.g': set([9]), 'b.g': None})
+
+            # 5 warnings in a.g and b.g
+            run_gaplint(changed_since='HEAD', max_warnings=6, silent=True,
+                        cache=False)
+            with self.assertRaises(SystemExit):
+                run_gaplint(changed_since='HEAD', max_warnings=5, silent=True,
+                            cache=False)
+            # 2 warnings in the changed lines of a.g and b.g
+            run_gaplint(changed_since='HEAD', only_changed_lines=True,
+                        max_warnings=3, silent=True, cache=False)
+            with self.assertRaises(SystemExit):
+                run_gaplint(changed_since='HEAD', only_changed_lines=True,
+                            max_warnings=2, silent=True, cache=False)
+            # 1 warning in b.g, the only changed file among those given
+            run_gaplint(changed_since='HEAD', files=['b.g', 'c.txt'],
+                        max_warnings=2, silent=True, cache=False)
+            with self.assertRaises(SystemExit):
+                run_gaplint(changed_since='HEAD', files=[tmpdir],
+                            max_warnings=5, silent=True, cache=False)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_changed_since_quoted_paths(self):
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.chdir(tmpdir)
+            fnames = ['a b.g', 'c"d.g', 'e\\f.g', 'g\th.g']
+            for fname in fnames:
+                with open(fname, 'w') as ffile:
+                    ffile.write('x := 1;\n')
+            for git_args in (['init', '-q'], ['add', '.'],
+                             ['-c', 'user.name=gaplint',
+                              '-c', 'user.email=gaplint', 'commit', '-q',
+                              '-m', 'init']):
+                subprocess.check_call(['git'] + git_args)
+            for fname in fnames:
+                with open(fname, 'a') as ffile:
+                    ffile.write('y:=2;\n')
+            # git quotes these paths, or adds a tab after them, in a diff
+            self.assertEqual(gaplint.__dict__['__get_changed_files']('HEAD'),
+                             dict((fname, set([1])) for fname in fnames))
+            with self.assertRaises(SystemExit):
+                run_gaplint(changed_since='HEAD', max_warnings=4, silent=True,
+                            cache=False)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_directories(self):
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmpdir, 'd', 'sub'))
+            shutil.copy('tests/test4.g', os.path.join(tmpdir, 'd', 'a.g'))
+            os.chdir(tmpdir)
+            for fname in ('d/sub/b.g', 'd/sub/gen_c.g', 'd/c.txt'):
+                with open(fname, 'w') as ffile:
+                    ffile.write('u:=6;\n')
+            with open('.gaplint.yml', 'w') as ffile:
+                ffile.write('exclude:\n- gen_*\n')
+
+            # 4 warnings in d/a.g and d/sub/b.g
+            for jobs in (1, 2):
+                run_gaplint(files=['d'], max_warnings=5, silent=True,
+                            cache=False, jobs=jobs)
+                with self.assertRaises(SystemExit):
+                    run_gaplint(files=['d'], max_warnings=4, silent=True,
+                                cache=False, jobs=jobs)
+
+            subprocess.check_call(['git', 'init', '-q'])
+            with open('.gitignore', 'w') as ffile:
+                ffile.write('b.g\n')
+            # 3 warnings in d/a.g
+            run_gaplint(files=['d'], max_warnings=4, silent=True, cache=False)
+            with self.assertRaises(SystemExit):
+                run_gaplint(files=['d'], max_warnings=3, silent=True,
+                            cache=False)
+
+            # git lists the files in d when run from outside the work tree,
+            # where gen_c.g is not excluded
+            os.chdir(os.path.join(tmpdir, '..'))
+            path = os.path.join(tmpdir, 'd')
+            run_gaplint(files=[path], max_warnings=5, silent=True, cache=False)
+            with self.assertRaises(SystemExit):
+                run_gaplint(files=[path], max_warnings=4, silent=True,
+                            cache=False)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_nested_config(self):
+        cwd, stdout = os.getcwd(), sys.stdout
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmpdir, 'pkg', 'sub'))
+            for fname in ('a.g', 'pkg/a.g', 'pkg/sub/a.g'):
+                shutil.copy('tests/test4.g', os.path.join(tmpdir, fname))
+            os.chdir(tmpdir)
+            os.mkdir('.git') # the search for .gaplint.yml stops here
+            with open('pkg/.gaplint.yml', 'w') as ffile:
+                ffile.write('disable:\n- W011\n')
+            for jobs in (1, 2):
+                sys.stdout = StringIO.StringIO()
+                run_gaplint(files=['a.g', 'pkg'], format='jsonl',
+                            cache=False, jobs=jobs)
+                self.assertEqual(sorted(json.loads(x)['file'] for x in
+                                        sys.stdout.getvalue().splitlines()),
+                                 ['a.g'] * 3 + ['pkg/a.g', 'pkg/sub/a.g'])
+            # the script is loaded again when it changes
+            with open('pkg/.gaplint.yml', 'w') as ffile:
+                ffile.write('disable:\n- W002\n- W011\n')
+            sys.stdout = StringIO.StringIO()
+            run_gaplint(files=['pkg'], format='jsonl', cache=False)
+            self.assertEqual(sys.stdout.getvalue(), '')
+            # unused function arguments are reported if configured
+            with open('pkg/f.g', 'w') as ffile:
+                ffile.write('f := function(x, y)\n  return x;\nend;\n')
+            with open('pkg/.gaplint.yml', 'w') as ffile:
+                ffile.write('report_unused_args: true\n')
+            sys.stdout = StringIO.StringIO()
+            run_gaplint(files=['pkg/f.g'], format='jsonl', cache=False)
+            self.assertEqual([json.loads(x)['code'] for x in
+                              sys.stdout.getvalue().splitlines()], ['W028'])
+        finally:
+            sys.stdout = stdout
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_Linter(self):
+        linter = gaplint.Linter()
+        result = linter.lint_file('tests/test4.g')
+        self.assertEqual(result.fname, 'tests/test4.g')
+        self.assertEqual(result.nr_lines, 9)
+        self.assertEqual(len(result.warnings), 3)
+        self.assertEqual(len(result.notes), 0)
+        self.assertFalse(result.abort)
+        self.assertEqual(linter.lint_file('tests/test4.g').warnings,
+                         result.warnings)
+
+        source = 'x := 1;\n' + 'y' * 90 + ' := 2;\n'
+        self.assertEqual(linter.lint_source(source).warnings,
+                         [(1, 'too long line (96 / 80)', 'W001', 80)])
+        self.assertEqual(gaplint.Linter(columns=100).lint_source(source)
+                         .warnings, [])
+        self.assertEqual(gaplint.Linter(disable=['line-too-long'])
+                         .lint_source(source).warnings, [])
+        self.assertEqual(linter.lint_source(source, changed=set([0]))
+                         .warnings, [])
+        self.assertEqual(len(gaplint.Linter(max_warnings=2)
+                             .lint_file('tests/test4.g').warnings), 2)
+        # a tst file without any lines starting with gap>
+        self.assertEqual(linter.lint_source(source, ext='tst').warnings, [])
+        with self.assertRaises(IOError):
+            linter.lint_file('tests/nonexistent.g')
+        # the WarnRegexGroups of a Linter only hold its own rules
+        other = gaplint.Linter()
+        other.lint_file('tests/test4.g')
+        for lin in (linter, other):
+            self.assertTrue(lin._groups)
+            for group in lin._groups.values():
+                self.assertTrue(all(any(x is y for y in lin.rules)
+                                    for x in group.rules))
+
+    def test_profile_rules(self):
+        result = gaplint.Linter(profile=True).lint_file('tests/test4.g')
+        self.assertEqual(result.warnings,
+                         gaplint.Linter().lint_file('tests/test4.g').warnings)
+        self.assertEqual(result.profile['lines'], 9)
+        self.assertEqual(result.profile['rules']['W001']['calls'], 9)
+        self.assertEqual(result.profile['rules']['W011']['warnings'], 2)
+        self.assertIsNone(gaplint.Linter().lint_file('tests/test4.g').profile)
+
+        stderr = sys.stderr
+        try:
+            sys.stderr = StringIO.StringIO()
+            run_gaplint(files=['tests/test4.g', 'tests/test.tst'],
+                        silent=True, cache=False, profile_rules='json')
+            profile = json.loads(sys.stderr.getvalue().splitlines()[-1])
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(sorted(x['file'] for x in profile['files']),
+                         ['tests/test.tst', 'tests/test4.g'])
+        rules = dict((x['code'], x) for x in profile['rules'])
+        self.assertEqual(rules['W011']['rule'], 'whitespace-op-colon-equals')
+        self.assertEqual(rules['W001']['calls'],
+                         sum(x['lines'] for x in profile['files']))
+
+    def test_lazy_imports(self):
+        # importing gaplint, and linting without a .gaplint.yml, does not
+        # import yaml
+        subprocess.check_call([sys.executable, '-c', 'import sys, gaplint; '
+                               + 'gaplint.Linter().lint_source("x := 1;\\n"); '
+                               + 'sys.exit("yaml" in sys.modules)'])
+
+    def test_server(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'gaplint.sock')
+        command = [sys.executable, 'gaplint.py', '--socket', path,
+                   '--no-cache']
+        server = subprocess.Popen(command + ['--server', '--silent'])
+        try:
+            for i in xrange(100):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.05)
+            client = subprocess.Popen(command + ['--client', 'tests/test4.g'],
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE)
+            out, err = client.communicate()
+            self.assertEqual(client.returncode, 1)
+            self.assertEqual(err.count('WARNING in tests/test4.g'), 3)
+            self.assertEqual(subprocess.call(command + ['--client', '--silent',
+                                                        'tests/test.tst']), 0)
+        finally:
+            server.terminate()
+            server.wait()
+        self.assertFalse(os.path.exists(path))
+        # without a server the files are linted by the client
+        with open(os.devnull, 'w') as devnull:
+            self.assertEqual(subprocess.call(command + ['--client',
+                                                        'tests/test4.g'],
+                                             stdout=devnull, stderr=devnull),
+                             1)
+        # nor is a request sent to a socket owned by another user
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(path)
+            sock.listen(1)
+            if os.getuid() == 0:
+                os.chown(path, 65534, -1)
+            else:
+                os.remove(path) # only root can give the socket away
+                open(path, 'w').close()
+            client = subprocess.Popen(command + ['--client', 'tests/test4.g'],
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE)
+            out, err = client.communicate()
+            self.assertEqual(client.returncode, 1)
+            self.assertTrue('IGNORING ' + path in out + err)
+            self.assertEqual(err.count('WARNING in tests/test4.g'), 3)
+        finally:
+            sock.close()
+        shutil.rmtree(tmpdir)
+
+    def test_lint_iter(self):
+        linter = gaplint.Linter()
+        for fname in ('tests/test.g', 'tests/test4.g', 'tests/test.tst'):
+            with open(fname, 'r') as ffile:
+                lines = ffile.readlines()
+            expected = linter.lint_lines(lines, fname)
+            with open(fname, 'r') as ffile:
+                result = linter.lint_iter(ffile, fname)
+            self.assertEqual(result.warnings, expected.warnings)
+            self.assertEqual(result.notes, expected.notes)
+
+        lines = ['# gaplint: disable=W011\n', 'x:=1;\n', 'y:=2;\n',
+                 '# gaplint: disable(nextline)=W014, W005\n',
+                 'z:=1+1;\n', 'w:=1+1; # gaplint: disable=\n']
+        result = linter.lint_iter(iter(lines), 'x.g')
+        self.assertEqual(result.nr_lines, 6)
+        self.assertEqual(result.warnings,
+                         [(5, 'wrong whitespace around operator +', 'W014',
+                           4)])
+        self.assertEqual(result.notes, [(5, 'suppressions: invalid/no rule '
+                                         + 'code(s) or name(s) given')])
+        self.assertEqual(linter.lint_iter(lines, 'x.tst').warnings, [])
+
+    def test_stdin(self):
+        stdin = sys.stdin
+        try:
+            with open('tests/test4.g', 'r') as ffile:
+                sys.stdin = StringIO.StringIO(ffile.read())
+            run_gaplint(stdin_filename='test4.g', max_warnings=4, silent=True)
+            sys.stdin.seek(0)
+            with self.assertRaises(SystemExit):
+                run_gaplint(stdin_filename='test4.g', max_warnings=3,
+                            silent=True)
+            sys.stdin.seek(0)
+            with self.assertRaises(SystemExit):
+                run_gaplint(stdin_filename='test4.g', files=['tests/test4.g'],
+                            max_warnings=4, silent=True)
+        finally:
+            sys.stdin = stdin
+
+    def test_format(self):
+        stdout = sys.stdout
+        outputs = {}
+        try:
+            for fmt in ('json', 'jsonl', 'sarif', 'checkstyle'):
+                sys.stdout = StringIO.StringIO()
+                run_gaplint(files=['tests/test4.g', 'tests/test.tst'],
+                            format=fmt, cache=False)
+                outputs[fmt] = sys.stdout.getvalue()
+                sys.stdout = StringIO.StringIO()
+                with self.assertRaises(SystemExit):
+                    run_gaplint(files=['tests/test4.g'], format=fmt,
+                                max_warnings=2, silent=True, cache=False)
+                outputs[fmt + '-abort'] = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        warnings = json.loads(outputs['json'])
+        self.assertEqual(warnings, [json.loads(x) for x in
+                                    outputs['jsonl'].splitlines()])
+        self.assertEqual(warnings[0],
+                         {'file': 'tests/test4.g', 'line': 3, 'column': 1,
+                          'code': 'W011', 'message':
+                          'wrong whitespace around operator :=',
+                          'rule': 'whitespace-op-colon-equals'})
+        self.assertEqual([(x['line'], x['column'], x['code'])
+                          for x in warnings],
+                         [(3, 1, 'W011'), (5, None, 'W002'),
+                          (9, 1, 'W011')])
+        self.assertEqual(len(json.loads(outputs['json-abort'])), 2)
+
+        sarif = json.loads(outputs['sarif'])
+        self.assertEqual(sarif['version'], '2.1.0')
+        results = sarif['runs'][0]['results']
+        self.assertEqual([x['ruleId'] for x in results],
+                         ['W011', 'W002', 'W011'])
+        self.assertEqual(results[0]['locations'][0]['physicalLocation'],
+                         {'artifactLocation': {'uri': 'tests/test4.g'},
+                          'region': {'startLine': 3, 'startColumn': 1}})
+        json.loads(outputs['sarif-abort'])
+
+        dom = xml.dom.minidom.parseString(outputs['checkstyle'])
+        self.assertEqual([x.getAttribute('name') for x in
+                          dom.getElementsByTagName('file')], ['tests/test4.g'])
+        self.assertEqual([x.getAttribute('source') for x in
+                          dom.getElementsByTagName('error')],
+                         ['gaplint.W011', 'gaplint.W002', 'gaplint.W011'])
+        xml.dom.minidom.parseString(outputs['checkstyle-abort'])
+
     def test_wrong_ext(self):
         run_gaplint(files=['tests/file.wrongext'], silent=True)
 
@@ -83,6 +577,33 @@ class TestScript(unittest.TestCase):
             gaplint._info_warn('test', 'test', 'test', 'test')
         gaplint._info_warn('tests/test.g', 0, 'test', 0)
 
+    def test_paint(self):
+        colour = gaplint._COLOUR
+        try:
+            gaplint._COLOUR = 'always'
+            self.assertEquals(gaplint._paint(gaplint._red_string, 'test',
+                                             StringIO.StringIO()),
+                              '\033[31mtest\033[0m')
+            gaplint._COLOUR = 'never'
+            self.assertEquals(gaplint._paint(gaplint._red_string, 'test',
+                                             sys.stderr), 'test')
+            gaplint._COLOUR = 'auto' # StringIO has no isatty
+            self.assertEquals(gaplint._paint(gaplint._red_string, 'test',
+                                             StringIO.StringIO()), 'test')
+        finally:
+            gaplint._COLOUR = colour
+
+    def test_OutputSink(self):
+        out, err = StringIO.StringIO(), StringIO.StringIO()
+        sink = gaplint._OutputSink()
+        for stream, text in ((err, 'a'), (err, 'b'), (out, 'c'), (err, 'd')):
+            sink.write(stream, text)
+        self.assertEquals((out.getvalue(), err.getvalue()), ('', ''))
+        sink.flush()
+        self.assertEquals((out.getvalue(), err.getvalue()), ('c', 'abd'))
+        sink.flush()
+        self.assertEquals((out.getvalue(), err.getvalue()), ('c', 'abd'))
+
 class TestRules(unittest.TestCase):
     def test_ReplaceMultilineStrings(self):
         rule = gaplint.ReplaceMultilineStrings()
@@ -134,9 +655,86 @@ class TestRules(unittest.TestCase):
         self.assertEquals(ro.abort, True)
 
     def test_RemoveComments(self):
-        rule = gaplint.RemoveComments()
+        rule = gaplint.RemoveComments('remove-comments', 'M001')
         ro = rule(r"' before a #")
         assert isinstance(ro, gaplint.RuleOutput)
+        self.assertEquals(ro.line, r"' before a #")
+
+        self.assertEquals(rule('x := 1; # a comment\n').line, 'x := 1; \n')
+        self.assertEquals(rule('x := "#"; # a comment').line, 'x := "#"; ')
+        self.assertEquals(rule(r'x := "\"#"; # a').line, r'x := "\"#"; ')
+        self.assertEquals(rule("x := '#'; # a comment").line, "x := '#'; ")
+        self.assertEquals(rule('x := 1;\n').line, 'x := 1;\n')
+
+    def test_Tokenizer(self):
+        tokenize = gaplint.Tokenizer()
+        tokens = tokenize('f := function(x, y) return x; end')
+        assert isinstance(tokens, gaplint.Tokens)
+        self.assertEquals(tokens.names, frozenset(['f', 'function', 'x', 'y',
+                                                   'return', 'end']))
+        self.assertEquals(tokens.find('function'), (5, 13))
+        self.assertEquals(tokens.find('end'), None) # not followed by anything
+        self.assertEquals(tokens.between(14, 18), ['x', 'y'])
+        self.assertEquals(tokens.between(0, -1), [])
+        assert tokenize('f := function(x, y) return x; end') is tokens
+
+    def test_WarnRegexGroup(self):
+        self.assertEquals(gaplint._non_capturing(r'(\(|[(])(?:x)(a(b))'),
+                          r'(?:\(|[(])(?:x)(?:a(?:b))')
+        rules = [rule for rule in gaplint.RULES
+                 if type(rule) in (gaplint.WarnRegex,
+                                   gaplint.WhitespaceOperator)]
+        combined = gaplint.WarnRegexGroup(rules)
+        combined._COMBINE_AFTER = combined._COMBINE_MIN_RULES = 0
+        groups = [gaplint.WarnRegexGroup(rules), combined]
+        for line in ['x := 1;\n', 'x:=1+ 2;', 'f := function ( x ) ;;',
+                     'return - 1 * [1..2];', 'x^ -1 <>3', '', '\t']:
+            for group in groups:
+                self.assertEquals(group.matching(line),
+                                  [i for i, rule in enumerate(rules)
+                                   if rule._pattern.search(line)])
+                self.assertEquals([(rule.code, ro.msg)
+                                   for rule, ro in group(line)],
+                                  [(rule.code, rule(line).msg)
+                                   for rule in rules if rule(line).msg])
+        self.assertTrue(any(entry[1] is not None
+                            for entry in combined._combined.values()))
+
+    def test_triggers(self):
+        # a rule can only match a line containing one of its triggers
+        rules = [rule for rule in gaplint._make_rules()
+                 if rule.triggers is not None]
+        self.assertEquals(len(rules), 23)
+        group = gaplint.WarnRegexGroup(rules)
+        self.assertFalse('_pattern' in vars(rules[0])) # not yet compiled
+        for fname in ['tests/test.g', 'tests/test2.g', 'tests/test3.g',
+                      'tests/test4.g', 'tests/test.tst']:
+            for line in open(fname).readlines() + ['x <>-1;', ' \t\n']:
+                for i, rule in enumerate(rules):
+                    if rule._pattern.search(line):
+                        self.assertTrue(any(t in line for t in rule.triggers))
+                        self.assertTrue(i in group.matching(line))
+        self.assertEquals(group.matching('od;\n'), [])
+
+    def test_Indentation(self):
+        result = gaplint.Linter().lint_source('f := function(x)\n'
+                                              '  if x = 1 then\n'
+                                              '    for x in [1 .. 2] do\n'
+                                              '    fi;\n'
+                                              'end;\n'
+                                              'od;\n', 'a.g')
+        self.assertEquals(result.warnings,
+                          [(3, '\'fi\' does not match the \'for\' opened in '
+                            'line 3', 'W004', 4),
+                           (4, 'bad indentation: found 0 expected at least 2',
+                            'W004', None),
+                           (5, '\'od\' without a matching \'for\' or \'while\'',
+                            'W004', 0)])
+        rule = gaplint.Indentation('indentation', 'W004', 2)
+        self.assertEquals(rule('if true then x := 1; fi;\n').msg, None)
+        self.assertEquals(rule('repeat x := 1; od;\n').msg,
+                          '\'od\' does not match the \'repeat\' opened in '
+                          'line 1')
 
     def test_RemovePrefix(self):
         rule = gaplint.RemovePrefix()
@@ -145,7 +743,7 @@ class TestRules(unittest.TestCase):
         ro = rule('line has neither prefix', 'tst')
 
     def test_UnusedLVarsFunc(self):
-        rule = gaplint.UnusedLVarsFunc()
+        rule = gaplint.UnusedLVarsFunc('unused-local-variables', 'W028')
 
         ro = rule('function(x, x)')
         assert isinstance(ro, gaplint.RuleOutput)
@@ -187,6 +785,47 @@ class TestRules(unittest.TestCase):
         ro = rule('f := function(x);')
         ro = rule('local y')
         ro = rule(', z; end;')
+        self.assertEquals(rule._scopes, {})
+
+        rule.reset()
+        ro = rule('f := function(x)')
+        ro = rule('local y, z;')
+        ro = rule('return x + z;')
+        ro = rule('end;')
+        self.assertEquals(ro.msg, 'unused local variables: y (function '
+                          'declared in line 1)')
+        self.assertEquals(rule._scopes, {})
+
+    def test_UnusedLVarsFunc_scopes(self):
+        lines = ['f := function(x, y)\n',
+                 '  local a, b;\n',
+                 '  a := function(b)\n',
+                 '    local c;\n',
+                 '    return b;\n', # the argument b, not the local b
+                 '  end;\n',
+                 '  return a;\n',
+                 'end;\n']
+        result = gaplint.Linter().lint_lines(lines, 'a.g')
+        self.assertEquals([w[:3] for w in result.warnings],
+                          [(5, 'unused local variables: c (function declared '
+                            'in line 3)', 'W028'),
+                           (7, 'unused local variables: b (function declared '
+                            'in line 1)', 'W028')])
+        rule = gaplint.UnusedLVarsFunc('unused-local-variables', 'W028',
+                                       report_args=True)
+        msgs = [rule(line).msg for line in lines]
+        self.assertEquals(msgs[7], 'unused local variables: b; unused function'
+                          ' arguments: x, y (function declared in line 1)')
+        self.assertEquals(rule._scopes, {})
+        # the unused arguments are reported if configured
+        source = 'f := function(x, y)\n  return x;\nend;\n'
+        self.assertEquals(gaplint.Linter().lint_source(source, 'f.g')
+                          .warnings, [])
+        self.assertEquals([w[:3] for w in
+                           gaplint.Linter(report_unused_args=True)
+                           .lint_source(source, 'f.g').warnings],
+                          [(2, 'unused function arguments: y (function '
+                            'declared in line 1)', 'W028')])
 
     def test_run_gaplint(self):
         with self.assertRaises(SystemExit):
@@ -0,0 +1,9 @@
+# a header
+# gaplint: disable=W003
+x:=1; 
+
+
+y:=2;# gaplint: disable=W011
+# gaplint: disable(nextline)=whitespace-op-colon-equals
+z:=3;
+w:=4; 